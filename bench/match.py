@@ -0,0 +1,93 @@
+'''
+membership testing: DAWG.__contains__ against re.fullmatch on the serialized pattern,
+split patterns, and the disjoint serializer's pattern on hit and miss workloads
+
+    python -m bench.match [count] [wordlist]
+'''
+
+import random
+import re
+import sys
+import time
+
+from regroup import DAWG
+from bench.tokenizers import words
+
+
+def queries(wordlist, count, seed=0):
+    '''
+    half members, half near misses made by changing one character of a member
+    '''
+    rand = random.Random(seed)
+    out = []
+    for i in range(count):
+        w = rand.choice(wordlist)
+        if i % 2:
+            p = rand.randrange(len(w))
+            w = w[:p] + rand.choice('qrstuvwxyz') + w[p + 1:]
+        out.append(w)
+    return out
+
+
+def throughput(pattern, data):
+    compiled = re.compile(pattern)
+    elapsed, found = timed(lambda: [compiled.fullmatch(s) is not None for s in data])
+    return len(data) / elapsed, found
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def timed_compile(pattern):
+    # re keeps recently compiled patterns; without a purge a repeat compile times a lookup
+    re.purge()
+    return timed(lambda: re.compile(pattern))
+
+
+def main(count=100000, path=None):
+    wordlist = sorted(words(path))
+    data = queries(wordlist, int(count))
+    dawg = DAWG.from_list(wordlist)
+    elapsed, pattern = timed(dawg.serialize)
+    print('{} words, pattern of {} chars serialized in {:.2f}s'.format(
+        len(wordlist), len(pattern), elapsed))
+    elapsed, compiled = timed_compile(pattern)
+    print('re.compile {:.2f}s'.format(elapsed))
+    elapsed, expected = timed(lambda: [compiled.fullmatch(s) is not None for s in data])
+    print('re.fullmatch {} queries {:.2f}s ({:.0f}/s)'.format(len(data), elapsed, len(data) / elapsed))
+    elapsed, found = timed(lambda: list(dawg.match_many(data)))
+    print('DAWG.match_many {} queries {:.2f}s ({:.0f}/s)'.format(len(data), elapsed, len(data) / elapsed))
+    print('same answers:', expected == found)
+    for max_length in (2000, 20000):
+        patterns = dawg.serialize_bounded(max_length=max_length)
+        compile_times = []
+        compiled = []
+        for p in patterns:
+            elapsed, c = timed_compile(p)
+            compile_times.append(elapsed)
+            compiled.append(c)
+        elapsed, bounded = timed(lambda: [any(c.fullmatch(s) for c in compiled) for s in data])
+        print('max_length={}: {} patterns, re.compile {:.2f}s total {:.3f}s max, '
+              'fullmatch any {:.0f}/s, same answers: {}'.format(
+                  max_length, len(patterns), sum(compile_times), max(compile_times),
+                  len(data) / elapsed, bounded == expected))
+
+    hits, misses = data[0::2], data[1::2]
+    for name, serialize in (('serialize', dawg.serialize),
+                            ('serialize_disjoint', dawg.serialize_disjoint),
+                            ('serialize_disjoint atomic=False',
+                             lambda: dawg.serialize_disjoint(atomic=False))):
+        pattern = serialize()
+        elapsed, _ = timed_compile(pattern)
+        hit_rate, hit_found = throughput(pattern, hits)
+        miss_rate, miss_found = throughput(pattern, misses)
+        print('{}: {} chars, re.compile {:.2f}s, hits {:.0f}/s, misses {:.0f}/s, '
+              'same answers: {}'.format(name, len(pattern), elapsed, hit_rate, miss_rate,
+                                        hit_found + miss_found == expected[0::2] + expected[1::2]))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,49 @@
+'''
+time DAWGRelaxer.relax against a full rescan of every candidate per step,
+the way relax used to work, and check that both give the same pattern
+
+    python -m bench.relax [count] [threshold]
+'''
+
+import random
+import sys
+import time
+
+from regroup import DAWG, DAWGRelaxer
+
+
+def near_misses(count, seed=0):
+    '''
+    families of numbered file names, each missing one member, so every
+    family is one merge away from its siblings
+    '''
+    rand = random.Random(seed)
+    strings = []
+    for family in range(count // 30):
+        missing = (rand.choice('abc'), rand.randint(0, 9))
+        strings.extend('f{}{}{}'.format(family, letter, n)
+                       for letter in 'abc'
+                       for n in range(10)
+                       if (letter, n) != missing)
+    return strings
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+def main(count=2000, threshold=1):
+    count, threshold = int(count), int(threshold)
+    strings = near_misses(count)
+    t1, fast = timed(lambda: DAWGRelaxer(DAWG.from_iter(strings)).relax(threshold).serialize())
+    t2, slow = timed(lambda: DAWGRelaxer(DAWG.from_iter(strings)).relax_rescan(threshold).serialize())
+    print('{} strings threshold={}'.format(len(strings), threshold))
+    print('incremental {:8.3f}s'.format(t1))
+    print('rescan      {:8.3f}s'.format(t2))
+    print('same output: {}'.format(fast == slow))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
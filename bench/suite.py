@@ -0,0 +1,218 @@
+'''
+benchmark suite: wall time and peak memory of each pipeline stage over synthetic
+corpora, written as JSON and optionally compared against an earlier run
+
+    python -m bench.suite [--size N] [--repeat N] [--output results.json]
+                          [--baseline baseline.json] [--time-threshold 0.25]
+                          [--memory-threshold 0.25]
+
+exits non-zero if a stage got slower or bigger than its threshold allows,
+or if one of the README's examples no longer holds
+'''
+
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from regroup import (DAWG, DAWGRelaxer, DictionaryTokenizer, TaggingTokenizer, Trie,
+                     match)
+from regroup.cluster import agglomerate, distance_matrix
+
+COLORS = ['Black', 'Blue', 'Green', 'Red', 'White', 'Yellow']
+
+# stages faster than this are all noise
+MIN_SECONDS = 0.02
+MIN_BYTES = 64 * 1024
+
+# distance_matrix is quadratic, and slow under tracemalloc; cluster a prefix only
+CLUSTER_SAMPLE = 80
+
+
+def numbers(size, seed=0):
+    # the README's range(101) example, scaled up
+    return [str(n) for n in range(size)]
+
+
+def words(size, seed=0):
+    rand = random.Random(seed)
+    return [''.join(rand.choice('etaoinshrdlcumwfgypbvk') for _ in range(rand.randint(2, 10)))
+            for _ in range(size)]
+
+
+def filenames(size, seed=0):
+    # families like the README's EFgreen/J27RedP1 set
+    rand = random.Random(seed)
+    prefixes = ['EF', 'Entire', 'J27', 'Journal', 'K9', 'Ledger']
+    return ['{}{}{}P{}'.format(rand.choice(prefixes), rand.choice(['', 'S']),
+                               rand.choice(COLORS), rand.randint(1, 9))
+            for _ in range(size)]
+
+
+def hostnames(size, seed=0):
+    rand = random.Random(seed)
+
+    def host():
+        return '{}{:02d}.{}.{}.example.{}'.format(
+            rand.choice(['web', 'db', 'cache', 'api', 'worker']), rand.randint(1, 40),
+            rand.choice(['prod', 'staging', 'dev']),
+            rand.choice(['us-east-1', 'us-west-2', 'eu-west-1']),
+            rand.choice(['com', 'net', 'org']))
+    return [host() for _ in range(size)]
+
+
+def urls(size, seed=0):
+    rand = random.Random(seed)
+
+    def url():
+        return 'https://{}/{}/{}/{}?page={}'.format(
+            rand.choice(['example.com', 'static.example.com', 'api.example.net']),
+            rand.choice(['users', 'orders', 'items', 'search']),
+            rand.randint(1, 5000), rand.choice(['view', 'edit', 'history']),
+            rand.randint(1, 20))
+    return [url() for _ in range(size)]
+
+
+CORPORA = {
+    'numbers': numbers,
+    'words': words,
+    'filenames': filenames,
+    'hostnames': hostnames,
+    'urls': urls,
+}
+
+
+def stages(strings):
+    '''
+    (name, setup, run) per stage; setup builds the stage's input outside the measurement
+    '''
+    sample = sorted(set(strings))[:CLUSTER_SAMPLE]
+    dictionary = DictionaryTokenizer(words(2000, seed=1))
+    tagging = TaggingTokenizer({'$color': set(COLORS), '$number': re.compile(r'\d+')})
+    return [
+        ('trie', lambda: strings, Trie.from_list),
+        ('dawg', lambda: Trie.from_list(strings), DAWG.from_trie),
+        ('relax', lambda: DAWG.from_list(strings), lambda d: DAWGRelaxer(d).relax()),
+        ('serialize', lambda: DAWG.from_list(strings),
+         lambda d: DAWG.serialize_regex(d.dawg, pool=d.pool)),
+        ('agglomerate', lambda: sample, lambda s: agglomerate(s, distance_matrix(s))),
+        ('tokenize dictionary', lambda: strings,
+         lambda s: sum(1 for x in s for _ in dictionary.tokenize(x))),
+        ('tokenize tagging', lambda: strings,
+         lambda s: sum(1 for x in s for _ in tagging.tokenize(x))),
+    ]
+
+
+def measure(setup, run, repeat):
+    '''
+    best wall time of repeat runs, then peak traced memory of one more
+    '''
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    arg = setup()
+    tracemalloc.start()
+    run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def checks():
+    '''
+    examples the README shows, which should keep holding
+    '''
+    return {
+        'readme range(101)':
+            match(map(str, range(101))) == '(0|1(00?|[1-9]?)|[2-9][0-9]?)',
+        'readme Mississippi':
+            match(['Mississippi', 'Missouri']) == 'Miss(issipp|our)i',
+    }
+
+
+def run(size, repeat):
+    results = {}
+    for corpus, generate in CORPORA.items():
+        strings = generate(size)
+        for stage, setup, fn in stages(strings):
+            results['{}/{}'.format(corpus, stage)] = measure(setup, fn, repeat)
+    return {
+        'meta': {'python': platform.python_version(), 'size': size, 'repeat': repeat},
+        'results': results,
+        'checks': checks(),
+    }
+
+
+def compare(current, baseline, time_threshold, memory_threshold):
+    '''
+    return a line per stage that regressed past its threshold
+    '''
+    regressions = []
+    for name, now in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for metric, threshold, floor in (('seconds', time_threshold, MIN_SECONDS),
+                                         ('peak_bytes', memory_threshold, MIN_BYTES)):
+            if max(now[metric], base[metric]) < floor:
+                continue
+            if now[metric] > base[metric] * (1 + threshold):
+                regressions.append('{} {}: {:.4g} -> {:.4g} (+{:.0%})'.format(
+                    name, metric, base[metric], now[metric],
+                    now[metric] / max(base[metric], 1e-12) - 1))
+    return regressions
+
+
+def report(current):
+    for name, r in current['results'].items():
+        print('{:<32} {:>9.4f}s {:>10.1f}kB'.format(name, r['seconds'], r['peak_bytes'] / 1024))
+    for name, ok in current['checks'].items():
+        print('{:<32} {}'.format(name, 'ok' if ok else 'FAILED'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=2000,
+                        help='strings per corpus')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='time each stage this many times and keep the best')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results from an earlier run')
+    parser.add_argument('--time-threshold', type=float, default=0.25,
+                        help='allowed fractional slowdown per stage')
+    parser.add_argument('--memory-threshold', type=float, default=0.25,
+                        help='allowed fractional growth in peak memory per stage')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        # read before running, so --output may overwrite the same file
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta']['size'] != args.size:
+            parser.error('baseline was run with --size {}'.format(baseline['meta']['size']))
+
+    current = run(args.size, args.repeat)
+    report(current)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    failed = not all(current['checks'].values())
+    if baseline:
+        regressions = compare(current, baseline, args.time_threshold, args.memory_threshold)
+        for line in regressions:
+            print('regression:', line)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+'''
+tokenizer throughput
+
+    python -m bench.tokenizers [count] [wordlist]
+'''
+
+import random
+import re
+import sys
+import time
+
+from regroup import DictionaryTokenizer, TaggingTokenizer
+
+
+class SlicingTaggingTokenizer(TaggingTokenizer):
+
+    '''
+    the previous TaggingTokenizer: every tag is tried against a fresh slice at each step
+    '''
+
+    def tokenize(self, string):
+        matchstring = string
+        while matchstring:
+            token, tag = self.nexttoken(matchstring)
+            yield (token, tag)
+            matchstring = matchstring[len(token):]
+
+    def nexttoken(self, substr):
+        longest = ''
+        longesttag = None
+        for tagname, tagdef in self.tags.items():
+            m = self.tagmatch(substr, tagdef)
+            if m and len(m) > len(longest):
+                longest = m
+                longesttag = tagname
+        if longest:
+            return (longest, longesttag)
+        return (self.fallback(substr), None)
+
+
+def words(path=None, seed=0):
+    if path:
+        with open(path) as f:
+            return set(w.strip().lower() for w in f)
+    rand = random.Random(seed)
+    return set(''.join(rand.choice('abcdefghijklmnop') for _ in range(rand.randint(2, 9)))
+               for _ in range(100000))
+
+
+def strings(wordset, count, seed=0):
+    rand = random.Random(seed)
+    wordlist = sorted(wordset)
+    return [''.join(rand.choice(wordlist) for _ in range(3)) + str(rand.randint(0, 99))
+            for _ in range(count)]
+
+
+def throughput(tokenizer, data):
+    start = time.perf_counter()
+    tokens = sum(1 for s in data for _ in tokenizer.tokenize(s))
+    elapsed = time.perf_counter() - start
+    return elapsed, tokens
+
+
+def tags(wordset, count=1000, seed=0):
+    rand = random.Random(seed)
+    wordlist = sorted(wordset)
+    return {
+        '$word': set(rand.sample(wordlist, min(count, len(wordlist)))),
+        '$number': re.compile(r'\d+'),
+        '$color': set('Black Blue Green Red'.split()),
+    }
+
+
+def main(count=100000, path=None):
+    wordset = words(path)
+    data = strings(wordset, int(count))
+    start = time.perf_counter()
+    tokenizer = DictionaryTokenizer(wordset)
+    print('dictionary of {} words built in {:.2f}s'.format(
+        len(wordset), time.perf_counter() - start))
+    elapsed, tokens = throughput(tokenizer, data)
+    print('DictionaryTokenizer {} strings {} tokens {:.2f}s ({:.0f} strings/s)'.format(
+        len(data), tokens, elapsed, len(data) / elapsed))
+    tagset = tags(wordset)
+    for cls in (SlicingTaggingTokenizer, TaggingTokenizer):
+        elapsed, tokens = throughput(cls(tagset), data)
+        print('{} {} strings {} tokens {:.2f}s ({:.0f} strings/s)'.format(
+            cls.__name__, len(data), tokens, elapsed, len(data) / elapsed))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,46 @@
+'''
+compare the memory held by the array-backed Trie against the nested-dict
+trie it replaced
+
+    python -m bench.trie_memory [wordlist]
+'''
+
+import sys
+import tracemalloc
+
+from regroup import Trie
+
+
+def dict_trie(strings):
+    '''the original nested-dict trie, one dict per character'''
+    root = {}
+    for word in strings:
+        d = root
+        for token in word:
+            d = d.setdefault(token, {})
+        d[''] = {}
+    return root
+
+
+def measure(build, strings):
+    tracemalloc.start()
+    result = build(strings)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main(path='/usr/share/dict/words'):
+    with open(path) as f:
+        words = [w.rstrip('\r\n') for w in f]
+    print('{}: {} words'.format(path, len(words)))
+    for name, build in [('dict trie', dict_trie),
+                        ('array Trie', Trie.from_iter)]:
+        current, peak = measure(build, words)
+        print('{:<12} held={:>8.1f}MB peak={:>8.1f}MB'.format(
+            name, current / 2**20, peak / 2**20))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -5,11 +5,10 @@ we can define tags to identify substrings that belong to the same set
 such that strings with substrings in the same tags group similarly
 '''
 
-from collections import defaultdict
 from pprint import pprint
 import re
 
-from regroup import TaggingTokenizer, TaggedString
+from regroup import DAWG, TagClass, TaggingTokenizer, TaggedString
 
 strings = [
     'EFgreen',
@@ -46,30 +45,22 @@ tagged = [TaggedString(s, tokenizer=tok) for s in strings]
 print('strings tokenized and tagged:')
 pprint(tagged)
 
-print('group lists of tokens by pattern of (tag or token):')
-clusters = defaultdict(list)
-for t in tagged:
-    tagpattern = tuple((tag or tok) for tok, tag in t.tagged)
-    toks = [tok for tok, tag in t.tagged]
-    clusters[tagpattern].append(toks)
-clusters = dict(clusters)
-pprint(clusters, width=120)
 
+def paths(d, path='', count=1):
+    # each tag class edge stands for as many strings as it has members
+    for k, v in sorted(d.items()):
+        if not k:
+            yield path, count
+        elif isinstance(k, TagClass):
+            yield from paths(v, path + str(k), count * len(k.members))
+        else:
+            yield from paths(v, path + k, count)
 
-def group(words):
-    s = ','.join(sorted(words))
-    if len(words) > 1:
-        s = '[' + s + ']'
-    return s
 
+# tokens with the same tag at the same position merge where everything after them matches
+dawg = DAWG.from_iter(strings, tokenizer=tok)
 
 print('describe all strings whose pattern is seen 2+ times:')
-for pattern, stringparts in sorted(clusters.items()):
-    if len(stringparts) > 1:
-        patset = [set() if p in tags else p for p in pattern]
-        for strings in stringparts:
-            for i, part in enumerate(strings):
-                if isinstance(patset[i], set):
-                    patset[i].add(part)
-        patstr = ''.join(group(p) if isinstance(p, set) else p for p in patset)
-        print(patstr)
+for pattern, count in sorted(paths(dawg.dawg)):
+    if count > 1:
+        print(pattern)
@@ -4,13 +4,14 @@
 standalone program that reads input and outputs a regex that describes it
 """
 
-from regroup import DAWG, DAWGRelaxer
+from regroup import DAWG, DAWGRelaxer, Stats, Trie, serialize_clusters
 
 if __name__ == '__main__':
 
     # ./regroup.py --relax --cluster-prefix-len=2
 
     import argparse
+    import fileinput
     import re
     import sys
 
@@ -20,29 +21,78 @@ if __name__ == '__main__':
                         help='attempt to simplify pattern where possible')
     parser.add_argument('--cluster-prefix-len', type=int,
                         help='split by prefix of a given length')
+    parser.add_argument('--max-length', type=int,
+                        help='print several patterns, one per line, each at most this long')
+    parser.add_argument('--max-nodes', type=int,
+                        help='print several patterns, one per line, each covering at most this many nodes')
+    parser.add_argument('--disjoint', action='store_true',
+                        help='print a longer pattern that is faster to match')
     parser.add_argument('--count', action='store_true',
                         help='count matches against input')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='build, relax and serialize in this many processes')
+    parser.add_argument('--external', action='store_true',
+                        help='sort input through temporary files, for input larger than memory')
+    parser.add_argument('--save', metavar='PATH',
+                        help='also write the built DAWG to PATH')
+    parser.add_argument('--load', metavar='PATH',
+                        help='use a DAWG written by --save instead of reading input')
+    parser.add_argument('--stats', action='store_true',
+                        help='print stage timings and sizes to stderr')
+    parser.add_argument('files', nargs='*',
+                        help='files to read instead of stdin')
     args = parser.parse_args()
+    if args.external and args.count:
+        parser.error('--count needs per-line counts, which --external does not keep')
+    if args.load and args.count:
+        parser.error('--count needs the input, which --load does not read')
 
     # run
-    lines = [line.rstrip('\r\n') for line in sys.stdin.readlines()]
-    dawg = DAWG.from_iter(lines)
+    # stream lines straight into the trie; duplicates only bump a count
+    lines = (line.rstrip('\r\n') for line in fileinput.input(args.files))
+    stats = Stats()
+    if args.load:
+        dawg = DAWG.load(args.load)
+    elif args.external:
+        dawg = DAWG.from_external(lines, stats=stats)
+    elif args.jobs > 1 and not args.count:
+        # without --count nothing needs the trie, so build it in shards
+        dawg = DAWG.from_sharded(lines, jobs=args.jobs, stats=stats)
+    else:
+        trie = Trie.from_stream(lines, stats=stats)
+        dawg = DAWG.from_trie(trie, stats=stats)
+    if args.save:
+        dawg.save(args.save)
 
     if args.relax:
-        dawg = DAWGRelaxer(dawg).relax()
+        dawg = DAWGRelaxer(dawg).relax(stats=stats)
 
     # output
     # either we split/cluster one big pattern into sub-patterns by some method...
     # ...or we just dump one big pattern
     if args.cluster_prefix_len:
         clusters = dawg.cluster_by_prefixlen(args.cluster_prefix_len)
-        for prefix, suffix_tree in clusters:
-            d = DAWG.from_dawg(suffix_tree)
-            pattern = prefix + DAWGRelaxer(d).relax().serialize()
+        patterns = serialize_clusters(clusters, jobs=args.jobs, stats=stats)
+        for (prefix, suffix_tree), pattern in zip(clusters, patterns):
             if args.count:
-                cnt = sum(re.match('^' + pattern + '$', line) is not None for line in lines)
+                with stats.stage('count'):
+                    # only strings under this cluster's prefix can match its pattern
+                    compiled = re.compile('^' + pattern + '$')
+                    cnt = sum(count for line, count in trie.paths(prefix)
+                              if compiled.match(line) is not None)
                 print(cnt, pattern)
             else:
                 print(pattern)
+    elif args.disjoint:
+        print(dawg.serialize_disjoint(stats=stats))
+    elif args.max_length or args.max_nodes:
+        # ...or split it into patterns small enough for the regex engine, to be ORed...
+        for pattern in dawg.serialize_bounded(args.max_length, args.max_nodes, stats=stats):
+            print(pattern)
     else:
-        print(dawg.serialize())
+        # written as it is walked rather than built up as one string
+        dawg.dump(sys.stdout, stats=stats)
+        print()
+
+    if args.stats:
+        print(stats, file=sys.stderr)
@@ -1,22 +1,35 @@
 # vim: set ts=4 et:
 
-from collections import Counter, defaultdict
+from array import array
+from collections import ChainMap, Counter, defaultdict
 from copy import copy
 from functools import reduce
-from itertools import groupby
+from heapq import heappop, heappush
+from itertools import chain, groupby, islice
+from multiprocessing import Pool, Process, Queue
 from pprint import pprint, pformat
+from os.path import commonprefix
+import pickle
 import re
+import sys
+import time
+import traceback
+import warnings
 
 # relative imports
-from .tokenizer import Tokenizer, DictionaryTokenizer, Tagged, TaggingTokenizer
-from .relax import suffixes_diff, dict_merge
+from .tokenizer import Tokenizer, DictionaryTokenizer, Tagged, TagClass, TaggingTokenizer
+from .pool import NodePool
+from .relax import suffixes_diff, dict_merge, dict_count_recursive
+from .stats import Stats, dawg_size
+from .extsort import sorted_unique
+from . import storage
 
 
-def match(strings):
+def match(strings, stats=None):
     '''
     convenience wrapper for generating one regex from a list of strings
     '''
-    return DAWG.from_iter(strings).serialize()
+    return DAWG.from_trie(Trie.from_stream(strings, stats=stats), stats=stats).serialize(stats=stats)
 
 
 class StringSet:
@@ -34,6 +47,9 @@ class StringSet:
     def __iter__(self):
         return iter(self.strings.keys())
 
+    def items(self):
+        return self.strings.items()
+
 
 class TaggedString:
 
@@ -57,46 +73,263 @@ class Trie:
     Trie
     an n-ary string character tree
     ref: https://en.wikipedia.org/wiki/Trie
+
+    nodes live in flat parallel arrays instead of one dict per character:
+    labels[i] is the token on the edge into node i, child[i]/sibling[i] link
+    first-child/next-sibling, and end-of-string is a child labelled ''.
+    items()/keys()/values() present the same view as the old nested dicts
+
+    a tokenizer yielding tagged tokens (see TaggingTokenizer) gets a TagClass edge
+    holding one tagged string; DAWG._build collects the strings of a tag that lead to
+    the same suffixes into one TagClass;
+    counts[i] is how many input strings, duplicates included, end at node i
     '''
 
     def __init__(self, stringset=None, tokenizer=None):
         stringset = stringset or StringSet()
+        if not hasattr(stringset, 'items'):
+            # a plain iterable of strings, as the constructor has always taken
+            stringset = StringSet(stringset)
         self.tokenizer = tokenizer or Tokenizer()
-        self.trie = self._build(stringset)
+        self.labels = ['']
+        self.child = array('l', [-1])
+        self.sibling = array('l', [-1])
+        self.counts = array('l', [0])
+        self._build(stringset)
 
     @classmethod
-    def from_iter(cls, strings):
-        return cls(stringset=StringSet(strings))
+    def from_iter(cls, strings, tokenizer=None):
+        return cls(stringset=StringSet(strings), tokenizer=tokenizer)
 
     @classmethod
-    def from_list(cls, strings):
-        return cls.from_iter(strings)
+    def from_list(cls, strings, tokenizer=None):
+        return cls.from_iter(strings, tokenizer)
+
+    @classmethod
+    def from_stream(cls, strings, tokenizer=None, cache=65536, stats=None):
+        '''
+        build from an iterable consumed one string at a time; duplicates are only
+        counted, so memory grows with the trie rather than the input.
+        the end nodes of up to cache recent distinct strings are remembered, so
+        repeats skip re-tokenizing and walking the trie
+        '''
+        stats = stats or Stats()
+        t = cls(tokenizer=tokenizer)
+        ends = {}
+        n = 0
+        # reading the input is interleaved with tokenizing and inserting, so all count as 'trie'
+        with stats.stage('trie'):
+            for s in strings:
+                n += 1
+                i = ends.get(s)
+                if i is None:
+                    i = t.add(s)
+                    if len(ends) >= cache:
+                        ends.clear()
+                    ends[s] = i
+                else:
+                    t.counts[i] += 1
+        stats.set('strings', n)
+        stats.set('trie nodes', len(t))
+        stats.set('trie edges', len(t) - 1)
+        return t
 
     def __repr__(self):
-        return pformat(self.trie)
+        return pformat(self.as_dict())
 
     def __dict__(self):
-        return self.trie
+        return self.as_dict()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def root(self):
+        return TrieNode(self, 0)
 
     def items(self):
-        return self.trie.items()
+        return self.root().items()
 
     def keys(self):
-        return self.trie.keys()
+        return self.root().keys()
 
     def values(self):
-        return self.trie.values()
+        return self.root().values()
+
+    def as_dict(self):
+        return self.root().as_dict()
+
+    def paths(self, prefix=''):
+        '''
+        yield (string, count) for each distinct path starting with prefix,
+        tag classes written as [a,b]
+        '''
+        i = self.find(prefix)
+        if i == -1:
+            return iter(())
+        return self._paths(i, prefix)
+
+    def count_prefix(self, prefix=''):
+        '''
+        number of input strings, duplicates included, starting with prefix
+        '''
+        i = self.find(prefix)
+        if i == -1:
+            return 0
+        total = 0
+        todo = [self.child[i]]
+        while todo:
+            i = todo.pop()
+            while i != -1:
+                total += self.counts[i]
+                todo.append(self.child[i])
+                i = self.sibling[i]
+        return total
+
+    def find(self, prefix):
+        '''
+        return the node reached by prefix, or -1
+        '''
+        i = 0
+        for token in self.tokenizer.tokenize(prefix):
+            i = self.child[i]
+            while i != -1 and not self._reaches(self.labels[i], token):
+                i = self.sibling[i]
+            if i == -1:
+                break
+        return i
+
+    @staticmethod
+    def _reaches(label, token):
+        if isinstance(token, Tagged):
+            if token.tag is None:
+                return label == token.string
+            return isinstance(label, TagClass) and token.string in label.members
+        return label == token
+
+    def _paths(self, parent, path):
+        # explicit stack: long strings would exhaust the recursion limit
+        todo = [(self.child[parent], path)]
+        while todo:
+            i, path = todo.pop()
+            if i == -1:
+                continue
+            todo.append((self.sibling[i], path))
+            label = self.labels[i]
+            if label == '':
+                yield path, self.counts[i]
+            else:
+                todo.append((self.child[i], path + str(label)))
+
+    def _node(self, label):
+        self.labels.append(label)
+        self.child.append(-1)
+        self.sibling.append(-1)
+        self.counts.append(0)
+        return len(self.labels) - 1
+
+    def _insert(self, parent, label):
+        '''
+        return the child of parent reached via label, appending it if necessary
+        '''
+        i = self.child[parent]
+        if i == -1:
+            i = self.child[parent] = self._node(label)
+            return i
+        while True:
+            if self.labels[i] == label:
+                return i
+            nxt = self.sibling[i]
+            if nxt == -1:
+                # append at the end of the sibling chain to preserve insertion order
+                nxt = self.sibling[i] = self._node(label)
+                return nxt
+            i = nxt
 
     def _build(self, strings):
-        root = {}
-        for word in strings:
-            d = root
-            for token in self.tokenizer.tokenize(word):
-                d = d.setdefault(token, {})
-            # NOTE: all these empty dictionaries cost memory
-            # consider trading simplicity of implementation for efficiency by refactoring to None
-            d[''] = {}  # denote end-of-string
-        return root
+        for word, count in strings.items():
+            self.add(word, count)
+
+    def add(self, word, count=1):
+        '''
+        insert word, or count it again if already present; return its end node
+        '''
+        i = 0
+        for token in self.tokenizer.tokenize(word):
+            if isinstance(token, Tagged):
+                if token.tag is None:
+                    i = self._insert(i, token.string)
+                else:
+                    i = self._insert_tag(i, token)
+            else:
+                i = self._insert(i, token)
+        i = self._insert(i, '')  # denote end-of-string
+        self.counts[i] += count
+        return i
+
+    def _insert_tag(self, parent, token):
+        # one edge per tagged string; DAWG._build merges those whose suffixes agree
+        i = self.child[parent]
+        last = -1
+        while i != -1:
+            label = self.labels[i]
+            if isinstance(label, TagClass) and label.tag == token.tag and token.string in label.members:
+                return i
+            last, i = i, self.sibling[i]
+        i = self._node(TagClass(token.tag, [token.string]))
+        if last == -1:
+            self.child[parent] = i
+        else:
+            self.sibling[last] = i
+        return i
+
+
+class TrieNode:
+
+    '''
+    read-only dict-like view of one node in a Trie
+    '''
+
+    __slots__ = ('trie', 'index')
+
+    def __init__(self, trie, index):
+        self.trie = trie
+        self.index = index
+
+    def __repr__(self):
+        return pformat(self.as_dict())
+
+    def __len__(self):
+        return sum(1 for _ in self._children())
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, key):
+        return any(self.trie.labels[i] == key for i in self._children())
+
+    def _children(self):
+        child, sibling = self.trie.child, self.trie.sibling
+        i = child[self.index]
+        while i != -1:
+            yield i
+            i = sibling[i]
+
+    def items(self):
+        labels = self.trie.labels
+        for i in self._children():
+            yield labels[i], TrieNode(self.trie, i)
+
+    def keys(self):
+        labels = self.trie.labels
+        for i in self._children():
+            yield labels[i]
+
+    def values(self):
+        for i in self._children():
+            yield TrieNode(self.trie, i)
+
+    def as_dict(self):
+        return {k: v.as_dict() for k, v in self.items()}
 
 
 class DAWG:
@@ -107,27 +340,200 @@ class DAWG:
     ref: https://en.wikipedia.org/wiki/Deterministic_acyclic_finite_state_automaton
     '''
 
-    def __init__(self, trie=None):
-        self.dawg = DAWG._build(trie)
+    # add and remove leave the nodes they replaced in the pool; compact after this many
+    compact_every = 1000
+
+    def __init__(self, trie=None, pool=None):
+        self.pool = pool or NodePool()
+        self.serializer = RegexSerializer(self.pool)
+        self.dawg = DAWG._build(trie, pool=self.pool)
+        self.updates = 0
 
     @classmethod
-    def from_iter(cls, strings):
-        return cls(trie=Trie(StringSet(strings)))
+    def from_iter(cls, strings, tokenizer=None):
+        return cls(trie=Trie(StringSet(strings), tokenizer=tokenizer))
 
     @classmethod
-    def from_list(cls, strings):
-        return cls.from_iter(strings)
+    def from_list(cls, strings, tokenizer=None):
+        return cls.from_iter(strings, tokenizer)
 
     @classmethod
-    def from_trie(cls, t):
-        return cls(trie=t)
+    def from_trie(cls, t, stats=None):
+        stats = stats or Stats()
+        with stats.stage('dawg'):
+            x = cls(trie=t)
+        nodes, edges = dawg_size(x.dawg)
+        stats.set('dawg nodes', nodes)
+        stats.set('dawg edges', edges)
+        return x
 
     @classmethod
-    def from_dawg(cls, d):
+    def from_sorted_iter(cls, strings, tokenizer=None):
+        '''
+        build a minimal DAWG incrementally from strings in sorted order; with a
+        tokenizer, sorted by their lists of tokens
+        subtrees are merged with an equivalent registered subtree as soon as no later
+        string can extend them, so memory grows with the minimized graph, not the trie
+        ref: Daciuk et al, "Incremental Construction of Minimal Acyclic Finite-State Automata"
+        '''
         x = cls(trie={})
-        x.dawg = d
+        root = cls._build_sorted(strings, tokenizer or Tokenizer())
+        x.dawg = cls._build(root, memo={}, pool=x.pool)
+        return x
+
+    @classmethod
+    def from_external(cls, strings, run_size=1000000, tmpdir=None, tokenizer=None, stats=None):
+        '''
+        build from strings in any order without holding them all: they are sorted and
+        deduped through temporary files on disk (see extsort), then streamed into
+        from_sorted_iter, so memory grows with run_size and the minimized graph
+        '''
+        stats = stats or Stats()
+        # from_sorted_iter wants tokens in order, which for longer tokens isn't string order
+        key = (lambda s: list(tokenizer.tokenize(s))) if tokenizer else None
+        # sorting is interleaved with building, so both count as one stage
+        with stats.stage('external build'):
+            x = cls.from_sorted_iter(
+                sorted_unique(_counted(strings, stats), run_size, tmpdir, key), tokenizer)
+        nodes, edges = dawg_size(x.dawg)
+        stats.set('dawg nodes', nodes)
+        stats.set('dawg edges', edges)
         return x
 
+    @classmethod
+    def load(cls, path):
+        '''
+        open a DAWG written by save; the file is memory-mapped and read lazily, so
+        loading costs next to nothing and processes loading one file share its pages
+        '''
+        x = cls(trie={})
+        x.storage = storage.Store(path)
+        x.dawg = x.storage.root()
+        return x
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            storage.save(self.dawg, f)
+
+    @classmethod
+    def from_dawg(cls, d, pool=None):
+        x = cls(trie={}, pool=pool)
+        x.dawg = x.pool.intern(d)
+        return x
+
+    @classmethod
+    def from_sharded(cls, strings, jobs=2, tokenizer=None, batch=10000, stats=None):
+        '''
+        build with jobs worker processes, each streaming its share of the strings into
+        its own trie and DAWG, which are then joined into the DAWG one process would build.
+        strings are shared out by what follows the prefix the first batch has in common,
+        so input like URLs that all start alike still spreads over every worker; with a
+        tokenizer, whose tokens may cross any other cut, by their first character
+        '''
+        stats = stats or Stats()
+        with stats.stage('sharded build'):
+            x = cls._from_sharded(_counted(strings, stats), jobs, tokenizer, batch, stats)
+        nodes, edges = dawg_size(x.dawg)
+        stats.set('dawg nodes', nodes)
+        stats.set('dawg edges', edges)
+        return x
+
+    @classmethod
+    def _from_sharded(cls, strings, jobs, tokenizer, batch, stats):
+        inboxes = [Queue(maxsize=4) for _ in range(jobs)]  # bounded so reading can't race ahead
+        results = Queue()
+        workers = [Process(target=_build_shard, args=(inbox, results, tokenizer))
+                   for inbox in inboxes]
+        for w in workers:
+            w.start()
+        done = False
+        try:
+            strings = iter(strings)
+            sample = list(islice(strings, batch))
+            shard_of = _sharder(sample, jobs, tokenizer)
+            counts = [0] * jobs
+            batches = [[] for _ in range(jobs)]
+            for s in chain(sample, strings):
+                shard = shard_of(s)
+                counts[shard] += 1
+                batches[shard].append(s)
+                if len(batches[shard]) >= batch:
+                    inboxes[shard].put(batches[shard])
+                    batches[shard] = []
+            for inbox, b in zip(inboxes, batches):
+                if b:
+                    inbox.put(b)
+                inbox.put(None)
+            outcomes = [results.get() for _ in workers]
+            done = True
+        finally:
+            # if reading the input failed, nothing will tell the workers to stop
+            for w in workers:
+                if not done:
+                    w.terminate()
+                w.join()
+        for outcome in outcomes:
+            if outcome[0] == 'error':
+                _, e, tb = outcome
+                raise e from ShardError(tb)
+        total = sum(counts)
+        # most of the input, and twice a fair share if that is more
+        if total >= jobs * batch and max(counts) > total * min(0.9, max(0.5, 2 / jobs)):
+            warnings.warn('one of {} shards got {} of {} strings; the build is barely parallel'.format(
+                jobs, max(counts), total), RuntimeWarning, stacklevel=3)
+        pool = NodePool()
+        roots = [pool.intern(root) for _, root, _ in outcomes]
+        if tokenizer is None:
+            memo = {}
+            root = reduce(lambda a, b: cls._union(a, b, pool, memo), roots, pool.empty)
+            # shards overlap along the prefixes they share, so count the joined trie
+            nodes = 1 + _trie_size(root, {})
+        else:
+            # shards never share a first character, so their root keys never meet;
+            # tag classes from different shards can still lead to the same subtree
+            root = cls._merge_tags({k: v for r in roots for k, v in r.items()}, pool)
+            root = pool.canonical(root)
+            # the shards' tries would join at one root
+            nodes = 1 + sum(n - 1 for _, _, n in outcomes)
+        stats.set('trie nodes', nodes)
+        stats.set('trie edges', nodes - 1)
+        return cls.from_dawg(root, pool=pool)
+
+    @classmethod
+    def _union(cls, a, b, pool, memo):
+        '''
+        the pooled DAWG of the strings of a and of b, both built from character tokens,
+        with chains merged as _build would; keys are split where they part, so it
+        doesn't matter how the strings were shared out
+        '''
+        if a is b or not b:
+            return a
+        if not a:
+            return b
+        key = (id(a), id(b))
+        made = memo.get(key)
+        if made is None:
+            made = dict(a)
+            byfirst = {k[:1]: k for k in a}
+            for kb, vb in b.items():
+                ka = byfirst.get(kb[:1])
+                if ka is None:
+                    made[kb] = vb
+                    continue
+                va = made.pop(ka)
+                common = len(commonprefix([ka, kb]))
+                if common < len(ka):
+                    va = pool.canonical({ka[common:]: va})
+                if common < len(kb):
+                    vb = pool.canonical({kb[common:]: vb})
+                k, v = ka[:common], cls._union(va, vb, pool, memo)
+                if k and len(v) == 1 and '' not in v:
+                    (k2, v), = v.items()
+                    k += k2
+                made[k] = v
+            made = memo[key] = pool.canonical(made)
+        return made
+
     def __repr__(self):
         return pformat(self.dawg)
 
@@ -144,22 +550,130 @@ class DAWG:
         return self.dawg.values()
 
     @classmethod
-    def _build(cls, t):
-
-        # FIXME: for a real DAWG, we need to handle shared suffixes for strings with different prefixes
-
-        # return dict(t.trie)
+    def _build(cls, t, memo=None, pool=None):
+
+        if isinstance(t, Trie) and pool is not None:
+            return cls._build_trie(t, pool)
+        # NOTE: a trie shares nothing, so only from_sorted_iter's already-minimized graph
+        # passes a memo; building each shared node once keeps the result shared too
+        if memo is not None and id(t) in memo:
+            return memo[id(t)]
         made = {}
         for k, v in t.items():
-            v = cls._build(v)
-            # merge substrings
-            if k and len(v) == 1 and '' not in v:
+            v = cls._build(v, memo, pool)
+            # merge substrings; a TagClass stays an edge of its own
+            if k and len(v) == 1 and '' not in v and isinstance(k, str):
                 k2, v2 = list(v.items())[0]
+                if not isinstance(k2, str):
+                    made[k] = v
+                    continue
                 made[k + k2] = v2
             else:
                 made[k] = v
+        if any(isinstance(k, TagClass) for k in made):
+            made = cls._merge_tags(made, pool)
+        if pool is not None:
+            # intern bottom-up so duplicate subtrees are dropped as soon as they are built
+            made = pool.canonical(made)
+        if memo is not None:
+            memo[id(t)] = made
         return made
 
+    @classmethod
+    def _build_trie(cls, trie, pool):
+        '''
+        _build straight off the trie's arrays, with no TrieNode views and no recursion.
+        a node is always appended after its parent, so walking the nodes backwards
+        builds every child before its parent
+        '''
+        labels, child, sibling = trie.labels, trie.child, trie.sibling
+        built = [None] * len(labels)
+        for i in range(len(labels) - 1, -1, -1):
+            made = {}
+            tagged = False
+            j = child[i]
+            while j != -1:
+                k, v = labels[j], built[j]
+                built[j] = None
+                j = sibling[j]
+                # merge substrings; a TagClass stays an edge of its own
+                if isinstance(k, str):
+                    if k and len(v) == 1 and '' not in v:
+                        k2 = next(iter(v))
+                        if isinstance(k2, str):
+                            made[k + k2] = v[k2]
+                            continue
+                else:
+                    tagged = True
+                made[k] = v
+            if tagged:
+                made = cls._merge_tags(made, pool)
+            elif len(made) == 1 and i and labels[i] and isinstance(labels[i], str) and '' not in made:
+                # the parent merges this edge into its own, so this node is never kept
+                built[i] = made
+                continue
+            built[i] = pool.canonical(made)
+        return built[0]
+
+    @staticmethod
+    def _merge_tags(made, pool):
+        '''
+        merge the TagClass keys of one tag that lead to the same subtree, so a tag
+        class holds exactly the strings that can be followed by the same suffixes
+        '''
+        merged = {}
+        for k, v in made.items():
+            if isinstance(k, TagClass):
+                v = pool.intern(v) if pool is not None else v
+                merged.setdefault((k.tag, id(v)), (set(), v))[0].update(k.members)
+        made = {k: v for k, v in made.items() if not isinstance(k, TagClass)}
+        for (tag, _), (members, v) in merged.items():
+            made[TagClass(tag, members)] = v
+        return made
+
+    @classmethod
+    def _build_sorted(cls, strings, tokenizer):
+        register = {}
+        end = {}  # every end-of-string shares one leaf
+        root = {}
+        path = [root]  # path[i] is reached from root via prev[:i]
+        prev = []
+        for word in strings:
+            tokens = list(tokenizer.tokenize(word))
+            if tokens < prev:
+                raise ValueError('input is not sorted: {!r}'.format(word))
+            common = 0
+            for a, b in zip(tokens, prev):
+                if a != b:
+                    break
+                common += 1
+            # nothing below the shared prefix can change any more
+            cls._minimize(path, prev, common, register)
+            node = path[common]
+            for token in tokens[common:]:
+                node[token] = {}
+                node = node[token]
+                path.append(node)
+            node[''] = end
+            prev = tokens
+        cls._minimize(path, prev, 0, register)
+        return root
+
+    @staticmethod
+    def _minimize(path, prev, depth, register):
+        '''
+        replace each node on path deeper than depth by its registered equivalent
+        '''
+        for i in range(len(path) - 1, depth, -1):
+            node = path[i]
+            # children are already minimized, so their identity stands in for their structure;
+            # sorted input inserts keys in a fixed order, so no need to sort them here
+            signature = tuple((k, id(v)) for k, v in node.items())
+            registered = register.setdefault(signature, node)
+            if registered is not node:
+                path[i - 1][prev[i - 1]] = registered
+        del path[depth + 1:]
+
     def flatten(d, clusters=None):
         return DAWG._flatten(d, '')
 
@@ -167,10 +681,112 @@ class DAWG:
     def _flatten(cls, d, path):
         for k, v in sorted(d.items()):
             if k:
-                yield from cls._flatten(v, path + k)
+                yield from cls._flatten(v, path + str(k))
             else:
                 yield path
 
+    def serialize_bounded(self, max_length=None, max_nodes=None, stats=None):
+        '''
+        serialize as a list of patterns that together match what serialize() does,
+        each at most max_length characters and covering at most max_nodes nodes.
+        a subtree too big for one pattern is cut like cluster_by_prefixlen, into
+        prefix + pattern per child, and neighbouring children small enough are packed
+        back into one pattern. a single key longer than max_length still gets its own
+        pattern, as there is nowhere left to cut
+        '''
+        stats = stats or Stats()
+        patterns = []
+        with stats.stage('serialize'):
+            self._bounded(self._root(), '', max_length, max_nodes, {}, patterns)
+        stats.set('patterns', len(patterns))
+        stats.set('pattern length', sum(map(len, patterns)))
+        self._serializer_stats(stats, self.serializer)
+        return patterns
+
+    def _bounded(self, node, prefix, max_length, max_nodes, sizes, patterns):
+        s = self._fits(node, prefix, max_length, max_nodes, sizes)
+        if s is not None:
+            patterns.append(s)
+            return
+        # where to cut is decided from each child's cached fragment and node count,
+        # so a wide node costs one pass over its children; only finished packs are
+        # serialized and interned
+        pack = []
+        length = nodes = 0
+        for k, v in sorted(node.items()):
+            klength, knodes = self._cost(k, v, max_length, sizes)
+            if pack and self._within(prefix, length + klength + len(pack), nodes + knodes,
+                                     max_length, max_nodes):
+                pack.append((k, v))
+                length += klength
+                nodes += knodes
+                continue
+            self._pack(pack, prefix, max_length, max_nodes, sizes, patterns)
+            pack = []
+            if self._within(prefix, klength, knodes, max_length, max_nodes):
+                pack = [(k, v)]
+                length, nodes = klength, knodes
+            elif v:
+                # a relaxed '' key can lead to a whole subtree
+                self._bounded(v, prefix + k, max_length, max_nodes, sizes, patterns)
+            else:
+                patterns.append(prefix + k)
+        self._pack(pack, prefix, max_length, max_nodes, sizes, patterns)
+
+    def _cost(self, k, v, max_length, sizes):
+        '''
+        (length, nodes) child k: v adds to a pattern as one member of its parent's group
+        '''
+        length = 0
+        if max_length is not None:
+            length = len(k) + (len(self.serializer.serialize(v, 1)) if v else 0)
+        return length, self._nodes(v, sizes)
+
+    @staticmethod
+    def _within(prefix, length, nodes, max_length, max_nodes):
+        # members plus separators, and room for the group's parens and a '?'
+        return ((max_length is None or len(prefix) + length + 3 <= max_length) and
+                (max_nodes is None or 1 + nodes <= max_nodes))
+
+    def _pack(self, pack, prefix, max_length, max_nodes, sizes, patterns):
+        '''
+        serialize the children in pack as one pattern, or halves of it if the
+        estimate was off; escaping can make a pattern longer than its members
+        '''
+        if not pack:
+            return
+        s = self._fits(self.pool.intern(dict(pack)), prefix, max_length, max_nodes, sizes)
+        if s is not None:
+            patterns.append(s)
+        elif len(pack) > 1:
+            half = len(pack) // 2
+            self._pack(pack[:half], prefix, max_length, max_nodes, sizes, patterns)
+            self._pack(pack[half:], prefix, max_length, max_nodes, sizes, patterns)
+        elif pack[0][1]:
+            k, v = pack[0]
+            self._bounded(v, prefix + k, max_length, max_nodes, sizes, patterns)
+        else:
+            patterns.append(prefix + pack[0][0])
+
+    def _fits(self, node, prefix, max_length, max_nodes, sizes):
+        '''
+        prefix + the pattern for node if that is within bounds, else None
+        '''
+        if max_nodes is not None and self._nodes(node, sizes) > max_nodes:
+            return None
+        s = prefix + self.serializer.serialize(node)
+        if max_length is not None and len(s) > max_length:
+            return None
+        return s
+
+    def _nodes(self, node, sizes):
+        # summed over children, so shared subtrees are counted once per parent:
+        # never less than the real count
+        n = sizes.get(id(node))
+        if n is None:
+            n = sizes[id(node)] = 1 + sum(self._nodes(v, sizes) for v in node.values())
+        return n
+
     def cluster_by_prefixlen(self, length):
         clusters = []
         DAWG._cluster_by_prefixlen(length, clusters, self.dawg, '')
@@ -180,7 +796,12 @@ class DAWG:
 
     @classmethod
     def _cluster_by_prefixlen(cls, length, clusters, d, path):
-        for k, v in sorted(d.items()):
+        # a prefix is literal text, so it stops where a tag class edge starts;
+        # such edges go together into one cluster under the path so far
+        tagged = {k: v for k, v in d.items() if not isinstance(k, str)}
+        if tagged:
+            clusters.append((path, tagged))
+        for k, v in sorted((k, v) for k, v in d.items() if isinstance(k, str)):
             path2 = path + k
             if len(path2) >= length:
                 # the length of the prefix we've seen meets or exceeds the prefix
@@ -223,33 +844,288 @@ class DAWG:
                 break
         return top
 
-    def serialize(self):
-        return DAWG.serialize_regex(self.dawg)
+    def __contains__(self, string):
+        '''
+        whether string is in the DAWG's language, the same strings serialize() matches,
+        found by walking its edges rather than through a regex.
+        relaxing can leave sibling keys with a common first character, so every edge
+        that fits is followed, and it can leave an empty key leading to a whole subtree,
+        so '' is an edge that consumes nothing; a string is in when it reaches a leaf
+        '''
+        if not self.dawg:
+            return False  # no strings at all, not the empty string
+        index = self._edge_index()
+        todo = [(self.dawg, 0)]
+        seen = set()
+        end = len(string)
+        while todo:
+            node, pos = todo.pop()
+            if (id(node), pos) in seen:
+                continue
+            seen.add((id(node), pos))
+            if not node:
+                if pos == end:
+                    return True
+                continue
+            v = node.get('')
+            if v is not None:
+                todo.append((v, pos))
+            if pos < end:
+                for k, v in index(node).get(string[pos], ()):
+                    if string.startswith(k, pos):
+                        todo.append((v, pos + len(k)))
+        return False
+
+    def match_many(self, strings):
+        '''
+        yield whether each of strings is in the DAWG, in order
+        '''
+        return map(self.__contains__, strings)
+
+    def _edge_index(self):
+        # per node, edges grouped by the first character of their key, built on first visit
+        # and kept while the root is unchanged
+        if getattr(self, 'edges', (None,))[0] is not self.dawg:
+            self.edges = (self.dawg, {})
+        edges = self.edges[1]
+
+        def index(node):
+            i = edges.get(id(node))
+            if i is None:
+                i = edges[id(node)] = defaultdict(list)
+                for k, v in node.items():
+                    # a tag class edge stands for each of its members
+                    for m in (k.members if isinstance(k, TagClass) else (k,)):
+                        if m:
+                            i[m[0]].append((m, v))
+                i.default_factory = None
+            return i
+        return index
+
+    def add(self, string):
+        '''
+        add string, copying only the nodes on its path; every other node stays shared,
+        so the serializer's cached fragments for them stay valid and only the new
+        path is serialized again. keys are split by character, which gives the same
+        DAWG as a rebuild for character-tokenized DAWGs like from_iter's
+        '''
+        self.dawg = self._add(self.interned(), string)
+        self._updated()
+
+    def remove(self, string):
+        '''
+        remove string, raising KeyError if it is not present; chains left with a
+        single member are merged back into their parent's key as a rebuild would.
+        in a relaxed DAWG the string may be spelled by several paths; all are cut
+        '''
+        if string not in self:
+            raise KeyError(string)
+        self.dawg = self._remove(self.interned(), string, {}) or self.pool.empty
+        self._updated()
+
+    def _updated(self):
+        self.updates += 1
+        if self.updates % self.compact_every == 0:
+            self.compact()
+
+    def compact(self):
+        '''
+        drop the pooled nodes and cached results no longer reachable from the root,
+        which add and remove leave behind. other DAWGs sharing the pool, like a relaxed
+        copy, keep working: their nodes are interned again as they are next used
+        '''
+        self.serializer.prune(self.pool.compact([self._root()]))
+
+    def _add(self, node, s):
+        pool = self.pool
+        made = dict(node)
+        if not s:
+            # relaxing can leave '' leading to a whole subtree, which keeps its strings
+            v = node.get('')
+            made[''] = self._add(v, '') if v else pool.empty
+            return pool.intern(made)
+        for k, v in node.items():
+            if k and k[0] == s[0]:
+                common = 1
+                while common < min(len(k), len(s)) and k[common] == s[common]:
+                    common += 1
+                del made[k]
+                if common < len(k):
+                    # split the key where s leaves it
+                    v = pool.intern({k[common:]: v})
+                elif not v:
+                    # a relaxed key can end at a bare leaf, which is its end of string
+                    v = pool.end
+                made[k[:common]] = self._add(v, s[common:])
+                return pool.intern(made)
+        made[s] = pool.end
+        return pool.intern(made)
+
+    def _remove(self, node, s, memo):
+        '''
+        node without the string s, or None if nothing is left.
+        every edge that can spell s is followed, '' as an edge consuming nothing,
+        like __contains__ does; memo holds the result per (node, remaining length)
+        '''
+        if not node:
+            return None if not s else node
+        key = (id(node), len(s))
+        if key in memo:
+            return memo[key]
+        pool = self.pool
+        made = {}
+        for k, v in node.items():
+            if s.startswith(k):
+                v2 = self._remove(v, s[len(k):], memo)
+                if v2 is None:
+                    continue
+                if k and v2 is not v and len(v2) == 1 and '' not in v2:
+                    (k2, v3), = v2.items()
+                    if k + k2 not in node and k + k2 not in made:
+                        made[k + k2] = v3
+                        continue
+                v = v2
+            made[k] = v
+        made = memo[key] = pool.intern(made) if made else None
+        return made
+
+    def interned(self):
+        '''
+        the root as a pooled node, for what builds new nodes from it; a loaded DAWG
+        is copied into the pool first, so new nodes and loaded ones compare by identity
+        '''
+        if isinstance(self.dawg, storage.MappedNode):
+            self.dawg = self.dawg.as_dict()
+        self.dawg = self.pool.intern(self.dawg)
+        return self.dawg
+
+    def _root(self):
+        # the root as a canonical node, for what only reads it; a loaded DAWG's
+        # nodes already are, so they are read in place
+        self.dawg = self.pool.intern(self.dawg)
+        return self.dawg
+
+    def dump(self, fp, stats=None):
+        '''
+        write the pattern to the file-like fp; same output as serialize
+        '''
+        stats = stats or Stats()
+        length = CountingWriter(fp)
+        with stats.stage('serialize'):
+            self.serializer.dump(self._root(), length)
+        stats.set('pattern length', length.count)
+        self._serializer_stats(stats, self.serializer)
+
+    def serialize_disjoint(self, atomic=None, stats=None):
+        '''
+        a pattern for the same strings laid out for matching speed; see DisjointSerializer
+        '''
+        stats = stats or Stats()
+        serializer = DisjointSerializer(self.pool, atomic)
+        with stats.stage('serialize'):
+            s = serializer.serialize(self._root())
+        stats.set('pattern length', len(s))
+        self._serializer_stats(stats, serializer)
+        return s
+
+    def serialize(self, stats=None):
+        stats = stats or Stats()
+        with stats.stage('serialize'):
+            s = self.serializer.serialize(self._root())
+        stats.set('pattern length', len(s))
+        self._serializer_stats(stats, self.serializer)
+        return s
+
+    @staticmethod
+    def _serializer_stats(stats, serializer):
+        stats.set('serializer cache hits', serializer.hits)
+        stats.set('serializer cache misses', serializer.misses)
 
     @classmethod
     def _serialize(cls, dawg):
         return cls.serialize_regex(dawg)
 
     @classmethod
-    def serialize_regex(cls, d, level=0):
+    def serialize_regex(cls, d, level=0, pool=None):
+        return RegexSerializer(pool).serialize(d, level)
+
+
+class CountingWriter:
+
+    '''
+    file-like wrapper counting the characters written through it
+    '''
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.count = 0
+
+    def write(self, s):
+        self.count += len(s)
+        return self.fp.write(s)
+
+
+class RegexSerializer:
+
+    '''
+    serialize DAWG subtrees as regex fragments
+    fragments are cached by subtree identity, so a subtree shared by many paths (as
+    interning and relaxing produce) is serialized once; hits/misses count cache use
+    '''
+
+    # keys are written as they are; tag class members are escaped as they become keys
+    member = staticmethod(escape)
+
+    def __init__(self, pool=None):
+        self.pool = pool or NodePool()
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.cache = {}
+        self.unions = {}    # (id(node), id(node)) -> _union
+        self.literals = {}  # id(node) -> _literal
+        self.bars = {}      # id(node) -> _bar
+        self.generation = self.pool.generation
+
+    def prune(self, keep):
+        '''
+        keep only what names the node ids in keep, as NodePool.compact returned them
+        '''
+        self.cache = {k: s for k, s in self.cache.items() if k[0] in keep}
+        self.unions = {k: v for k, v in self.unions.items()
+                       if k[0] in keep and k[1] in keep and id(v) in keep}
+        self.literals = {i: v for i, v in self.literals.items() if i in keep and id(v) in keep}
+        self.bars = {i: b for i, b in self.bars.items() if i in keep}
+        self.generation = self.pool.generation
+
+    def serialize(self, d, level=0):
+        if self.generation != self.pool.generation:
+            # the pool dropped nodes this cache may name by id
+            self.clear()
+        d = self._literal(self.pool.intern(d))
+        # a fragment only depends on level through whether keys get grouped,
+        # so every level below the top shares one entry
+        key = (id(d), level > 0)
+        s = self.cache.get(key)
+        if s is not None:
+            self.hits += 1
+            return s
+        self.misses += 1
+        s = self.cache[key] = self._serialize(d, level)
+        return s
+
+    def _serialize(self, d, level):
         # pprint(d)
         if d and is_char_class(d):
             s = as_char_class(d.keys())
-        elif d and all_suffixes_identical(d):
+        elif d and all_suffixes_identical(d, self.pool):
             # print('all_suffixes_identical', d)
             # condense suffixes from multiple keys within a subtree
             v = list(d.values())[0]
             # print('v', v)
-            if all_len1(d):
-                s = as_charclass(d.keys())
-            elif is_optional_char_class(d):
-                s = as_opt_charclass(d.keys())
-            elif is_optional(d):
-                s = as_optional_group(d.keys())
-                # s = escape(sorted(list(d.keys()))[1]) + '?'
-            else:
-                s = as_group(d.keys())
-            s += cls.serialize_regex(v, level=level + 1)
+            s = repr_identical_keys(d) + self.serialize(v, level + 1)
         elif is_optional_char_class(d):
             s = as_opt_charclass(d.keys())
         elif is_optional(d):
@@ -257,24 +1133,232 @@ class DAWG:
             s = opt_group(escape(sorted(list(d.keys()))[1])) + '?'
             # s = as_optional_group(d.keys())
         else:
-            bysuff = suffixes(d)
+            bysuff = suffixes(d, self.pool)
             # print('suffixes', bysuff)
             if len(bysuff) < len(d):
                 # at least one suffix shared
                 # print('shared suffix', bysuff)
                 # print('level=', level)
-                suffixed = [repr_keys(k, do_group=(level > 0)) +
-                            cls.serialize_regex(v, level=level + 1)
+                # top-level keys may go ungrouped only where nothing follows them
+                suffixed = [repr_keys(k, do_group=(level > 0 or bool(v))) +
+                            self.serialize(v, level + 1)
                             for v, k in bysuff]
                 # print('suffixed', suffixed)
                 s = group(suffixed)
             else:
-                grouped = [k + (cls.serialize_regex(v, level=level + 1) if v else '')
+                grouped = [k + (self.serialize(v, level + 1) if v else '')
                            for k, v in sorted(d.items())]
                 # print('grouped', grouped)
                 s = group(grouped)
         return s
 
+    def dump(self, d, fp, level=0):
+        '''
+        write serialize(d, level) to fp, streaming where the output's shape follows from
+        the keys alone: alternations are written member by member as their subtrees
+        are walked, so the whole pattern is never held in memory at once.
+        where the text of the fragments decides the shape (optional groups, character
+        classes) the fragment is built with serialize instead, and dropped once written
+        '''
+        if self.generation != self.pool.generation:
+            self.clear()
+        d = self._literal(self.pool.intern(d))
+        s = self.cache.get((id(d), level > 0))
+        if s is not None:
+            self.hits += 1
+            fp.write(s)
+            return
+        if len(d) == 1 and not is_optional_char_class(d) and not self._bar(d):
+            # a lone member is only grouped when its text holds a bare '|'
+            (k, v), = d.items()
+            fp.write(k)
+            if v:
+                self.dump(v, fp, level + 1)
+            return
+        if len(d) < 2 or is_char_class(d) or is_optional_char_class(d) or is_optional(d):
+            fp.write(self._transient(d, level))
+            return
+        if all_suffixes_identical(d, self.pool):
+            fp.write(repr_identical_keys(d))
+            self.dump(list(d.values())[0], fp, level + 1)
+            return
+        bysuff = suffixes(d, self.pool)
+        optional = ''
+        if len(bysuff) < len(d):
+            if '' in d or len(bysuff) < 2:
+                fp.write(self._transient(d, level))
+                return
+            # no key is empty, so no member is and the group is never optional
+            members = [(repr_keys(k, do_group=(level > 0 or bool(v))), v) for v, k in bysuff]
+        else:
+            members = sorted(d.items())
+            if '' in d:
+                # an optional group sorts its members by their text, which only
+                # follows from the keys when no two keys start alike
+                firsts = [k[0] for k in d if k]
+                if len(firsts) < 2 or len(set(firsts)) < len(firsts):
+                    fp.write(self._transient(d, level))
+                    return
+                members = members[1:]
+                optional = '?'
+        fp.write('(')
+        for i, (k, v) in enumerate(members):
+            if i:
+                fp.write('|')
+            fp.write(k)
+            if v:
+                self.dump(v, fp, level + 1)
+        fp.write(')' + optional)
+
+    def _transient(self, d, level):
+        '''
+        serialize(d, level), reusing cached fragments but keeping none of those it builds,
+        so what dump writes doesn't pile up in the cache
+        '''
+        cache = self.cache
+        self.cache = ChainMap({}, cache)
+        try:
+            return self.serialize(d, level)
+        finally:
+            self.cache = cache
+
+    def _bar(self, d):
+        # whether a key anywhere under d holds a '|'
+        bar = self.bars.get(id(d))
+        if bar is None:
+            bar = self.bars[id(d)] = any('|' in str(k) or self._bar(v) for k, v in d.items())
+        return bar
+
+    def _literal(self, d):
+        '''
+        d with each TagClass key replaced by its members, each leading to its subtree,
+        so a tag class is written as the alternation of its strings
+        '''
+        if not any(isinstance(k, TagClass) for k in d):
+            return d
+        made = self.literals.get(id(d))
+        if made is None:
+            made = {}
+            for k, v in d.items():
+                for m in (map(self.member, k.members) if isinstance(k, TagClass) else (k,)):
+                    made[m] = self._union(made[m], v) if m in made else v
+            made = self.literals[id(d)] = self.pool.intern(made)
+        return made
+
+    def _union(self, a, b):
+        '''
+        an interned node matching what either a or b does; unlike dict_merge, the
+        empty leaf that ends a string survives being merged with a longer subtree
+        '''
+        if a is b:
+            return a
+        if not a:
+            a, b = b, a
+        key = (id(a), id(b))
+        made = self.unions.get(key)
+        if made is not None:
+            return made
+        made = dict(a)
+        if not b:
+            # a plus the empty string
+            made[''] = self._union(a[''], b) if '' in a else b
+        else:
+            for k, vb in b.items():
+                made[k] = self._union(made[k], vb) if k in made else vb
+        made = self.unions[key] = self.pool.intern(made)
+        return made
+
+
+class DisjointSerializer(RegexSerializer):
+
+    '''
+    serialize DAWG subtrees as regex fragments tuned for matching speed over length:
+    the branches of every alternation start with different characters, so at most one
+    can get past its first character and a failed match is never retried down another.
+    a relaxed DAWG can have sibling keys that start alike; those are factored into one
+    key over the union of their subtrees first. branches come largest subtree first.
+    with atomic (the default on Python 3.11+, whose re supports it) groups are atomic
+    and optionals possessive, which is safe because each fragment runs to the end of
+    the string and there is only ever one way to continue
+    '''
+
+    # every key is escaped as it is written, members included
+    member = staticmethod(str)
+
+    def __init__(self, pool=None, atomic=None):
+        super().__init__(pool)
+        self.atomic = sys.version_info >= (3, 11) if atomic is None else atomic
+
+    def _serialize(self, d, level):
+        d = self._disjoint(d)
+        # keys of one character leading to the same subtree share a character class
+        classes = defaultdict(list)
+        branches = []
+        for k, v in d.items():
+            if len(k) == 1:
+                classes[id(v)].append(k)
+            elif k:
+                branches.append((escape(k), v))
+        for chars in classes.values():
+            v = d[chars[0]]
+            if len(chars) == 1:
+                branches.append((escape(chars[0]), v))
+            else:
+                branches.append(('[' + ''.join(sorted(map(escape, chars))) + ']', v))
+        branches.sort(key=lambda b: (-dict_count_recursive(b[1], self.pool), b[0]))
+        s = '|'.join(k + self.serialize(v, level + 1) for k, v in branches)
+        if not s:
+            return s
+        if '' in d:
+            if len(branches) > 1 or len(s) > 1:
+                s = self._group(s)
+            s += '?+' if self.atomic else '?'
+        elif len(branches) > 1:
+            s = self._group(s)
+        return s
+
+    def _group(self, s):
+        return ('(?>' if self.atomic else '(?:') + s + ')'
+
+    def _disjoint(self, d):
+        '''
+        d with its empty key's subtree folded in and keys starting alike merged under
+        their common prefix
+        '''
+        pool = self.pool
+        # relaxing can leave '' leading to a whole subtree, not just to the end;
+        # it matches where d does, so its branches join d's own
+        while d.get(''):
+            rest = {k: v for k, v in d.items() if k}
+            d = self._literal(self._union(pool.intern(rest), d['']))
+        byfirst = defaultdict(list)
+        for k, v in d.items():
+            byfirst[k[:1]].append((k, v))
+        if all(len(items) == 1 for items in byfirst.values()):
+            return d
+        made = {}
+        for first, items in byfirst.items():
+            if len(items) == 1:
+                k, v = items[0]
+                made[k] = v
+                continue
+            prefix = commonprefix([k for k, _ in items])
+            parts = [v if k == prefix else pool.intern({k[len(prefix):]: v}) for k, v in items]
+            made[prefix] = reduce(self._union, parts)
+        return pool.intern(made)
+
+
+def repr_identical_keys(d):
+    # keys of a node whose subtrees are all the same
+    if all_len1(d):
+        return as_charclass(d.keys())
+    elif is_optional_char_class(d):
+        return as_opt_charclass(d.keys())
+    elif is_optional(d):
+        return as_optional_group(d.keys())
+        # return escape(sorted(list(d.keys()))[1]) + '?'
+    return as_group(d.keys())
+
 
 def all_len1(l):
     return all(len(k) == 1 for k in l)
@@ -296,9 +1380,10 @@ def as_char_class(strings):
     return s
 
 
-def all_suffixes_identical(d):
-    vals = list(d.values())
-    return len(vals) > 1 and len(set(map(str, vals))) == 1
+def all_suffixes_identical(d, pool=None):
+    pool = pool or NodePool()
+    vals = [pool.intern(v) for v in d.values()]
+    return len(vals) > 1 and len(set(map(id, vals))) == 1
 
 
 def is_optional(d):
@@ -368,13 +1453,16 @@ def emptyish(x):
     return x
 
 
-def suffixes(d):
+def suffixes(d, pool=None):
     # match up keys with same values
-    return sorted(((k, [a for a, _ in v])
-                  for k, v in groupby(sorted(d.items(),
-                                             key=lambda x: repr(emptyish(x[0]))),
-                                      key=lambda x: emptyish(x[1]))),
-                  key=lambda x: (repr(x[1]), repr(x[0])))
+    # interned values compare by identity instead of re-stringifying whole subtrees
+    pool = pool or NodePool()
+    items = sorted(((k, pool.emptyish(pool.intern(v))) for k, v in d.items()),
+                   key=lambda x: repr(emptyish(x[0])))
+    # keys are never shared between groups, so they alone decide the order
+    return sorted(((v[0][1], [a for a, _ in v])
+                   for v in (list(g) for _, g in groupby(items, key=lambda x: id(x[1])))),
+                  key=lambda x: repr(x[1]))
 
 
 def as_charclass(l):
@@ -475,42 +1563,282 @@ class DAWGRelaxer:
         self.dawg = dawg
 
     def relaxable(self):
-        return DAWGRelaxer._relaxable(self.dawg.dawg)
+        return DAWGRelaxer._relaxable(self.dawg.dawg, self.dawg.pool)
 
     @classmethod
-    def _relaxable(cls, d):
-        diffcnt = suffixes_diff(d)
+    def _relaxable(cls, d, pool=None):
+        diffcnt = suffixes_diff(d, pool)
         if diffcnt:
             yield (diffcnt, d)
         for k, v in d.items():
             if len(v) > 1:
-                yield from cls._relaxable(v)
+                yield from cls._relaxable(v, pool)
 
-    def relax(self, threshold=1):
+    def relax(self, threshold=1, stats=None):
         '''
         merge similar DAWG subtrees that differ by <= threshold members
+
+        candidates wait in a heap keyed by (diff count, node); merging one rebuilds only
+        the ancestors of the merged subtree, so only those new nodes get scored.
+        ties are broken on repr(node), the same order a full rescan would pick
+        '''
+        stats = stats or Stats()
+        with stats.stage('relax'):
+            self._relax(threshold)
+        stats.set('relax iterations', self.iterations)
+        nodes, edges = dawg_size(self.dawg.dawg)
+        stats.set('relaxed nodes', nodes)
+        stats.set('relaxed edges', edges)
+        return self.dawg
+
+    def relax_rescan(self, threshold=1):
+        '''
+        relax by rescanning every candidate on each step, as relax originally did;
+        much slower, kept as the reference relax is checked against
         '''
         while True:
             rel = sorted(self.relaxable(), key=lambda x: (x[0], repr(x[1])))
-            # pprint(rel)
-            if rel and rel[0][0] <= threshold:
-                relaxme = rel[0]
-                relaxed = self.do_relax(relaxme[1])
-                self.dawg = DAWG.from_dawg(relaxed)
-            else:
+            if not rel or rel[0][0] > threshold:
+                return self.dawg
+            self.dawg = DAWG.from_dawg(self.do_relax(rel[0][1]), pool=self.dawg.pool)
+
+    def _relax(self, threshold):
+        pool = self.dawg.pool
+        self.root = self.dawg.interned()
+        self.live = {}     # id(node) -> node, for nodes reachable from root
+        self.parents = {}  # id(node) -> Counter of parent ids
+        self.scores = {}   # id(node) -> suffixes_diff
+        self.reprs = {}
+        self.heap = []
+        self.iterations = 0
+        self._push(self._link(self.root), threshold)
+        while self.heap:
+            best = self._pop(threshold)
+            if best is None:
                 break
-        return self.dawg
+            merged = self._merged(best)
+            self._replace_live(best, pool.intern({k: merged for k in best}), threshold)
+            self.iterations += 1
+        self.dawg = DAWG.from_dawg(self.root, pool=pool)
+
+    def _link(self, node, fresh=None):
+        '''
+        mark node and everything below it live; return the nodes that became live
+        and the live children they now point at
+        '''
+        fresh = [] if fresh is None else fresh
+        if id(node) in self.live:
+            return fresh
+        self.live[id(node)] = node
+        self.parents.setdefault(id(node), Counter())
+        fresh.append(node)
+        for v in node.values():
+            self._link(v, fresh)
+            self.parents[id(v)][id(node)] += 1
+            # v may have just become reachable through an eligible parent
+            fresh.append(v)
+        return fresh
+
+    def _unlink(self, node):
+        del self.live[id(node)]
+        del self.parents[id(node)]
+        for v in node.values():
+            parents = self.parents[id(v)]
+            parents[id(node)] -= 1
+            if not parents[id(node)]:
+                del parents[id(node)]
+            if not parents and v is not self.root:
+                self._unlink(v)
+
+    def _push(self, nodes, threshold):
+        pool = self.dawg.pool
+        for node in nodes:
+            if len(node) > 1:
+                score = self.scores.get(id(node))
+                if score is None:
+                    # past threshold the exact count no longer matters, so let it stop early
+                    score = self.scores[id(node)] = suffixes_diff(node, pool, limit=threshold)
+                # anything over threshold can never be picked, so it never enters the heap
+                if 0 < score <= threshold:
+                    heappush(self.heap, (score, id(node)))
+
+    def _pop(self, threshold):
+        '''
+        remove and return the best eligible candidate, or None
+        '''
+        while self.heap:
+            score = self.heap[0][0]
+            ties = {}
+            while self.heap and self.heap[0][0] == score:
+                _, i = heappop(self.heap)
+                node = self.live.get(i)
+                if node is not None and self._eligible(node, set()):
+                    ties[i] = node
+            if ties:
+                best = min(ties.values(), key=self._repr)
+                for i in ties:
+                    if i != id(best):
+                        heappush(self.heap, (score, i))
+                return best
+        return None
+
+    def _eligible(self, node, seen):
+        # same walk as _relaxable: the root, then children with more than one member
+        if node is self.root:
+            return True
+        if len(node) <= 1:
+            return False
+        for i in self.parents[id(node)]:
+            if i not in seen:
+                seen.add(i)
+                if self._eligible(self.live[i], seen):
+                    return True
+        return False
+
+    def _repr(self, node):
+        if id(node) not in self.reprs:
+            self.reprs[id(node)] = repr(node)
+        return self.reprs[id(node)]
+
+    def _replace_live(self, find, replace, threshold):
+        ancestors = set()
+        todo = [id(find)]
+        while todo:
+            for i in self.parents[todo.pop()]:
+                if i not in ancestors:
+                    ancestors.add(i)
+                    todo.append(i)
+        old = self.root
+        self.root = self._rebuild(old, find, replace, ancestors, {})
+        fresh = self._link(self.root)
+        if old is not self.root and not self.parents[id(old)]:
+            self._unlink(old)
+        self._push(fresh, threshold)
+
+    def _rebuild(self, node, find, replace, ancestors, memo):
+        if node is find:
+            return replace
+        if id(node) not in ancestors:
+            return node
+        if id(node) not in memo:
+            memo[id(node)] = self.dawg.pool.intern(
+                {k: self._rebuild(v, find, replace, ancestors, memo)
+                 for k, v in node.items()})
+        return memo[id(node)]
+
+    def _merged(self, d):
+        pool = self.dawg.pool
+        return reduce(lambda a, b: dict_merge(a, b, pool=pool), d.values(), pool.empty)
 
     def do_relax(self, d):
-        merged = reduce(dict_merge, d.values(), {})
+        merged = self._merged(d)
         d2 = {k: merged for k in d}
         # print('merged', merged)
         # print('d2', d2)
-        return DAWGRelaxer._replace(self.dawg.dawg, d, d2)
+        return DAWGRelaxer._replace(self.dawg.dawg, d, d2, {})
 
     @classmethod
-    def _replace(cls, dawg, find, replace):
-        if dawg == find:
+    def _replace(cls, dawg, find, replace, memo):
+        # subtrees are interned, so equal subtrees are the same object
+        if dawg is find:
             return replace
-        return {k: cls._replace(v, find, replace)
-                for k, v in dawg.items()}
+        if id(dawg) not in memo:
+            memo[id(dawg)] = {k: cls._replace(v, find, replace, memo)
+                              for k, v in dawg.items()}
+        return memo[id(dawg)]
+
+
+def serialize_clusters(clusters, jobs=1, stats=None):
+    '''
+    relax and serialize each (prefix, suffix tree) from DAWG.cluster_by_prefixlen,
+    yielding prefix + pattern in cluster order.
+    clusters are independent, so with jobs > 1 they are spread over a process pool
+    '''
+    stats = stats or Stats()
+    if jobs <= 1:
+        yield from _timed_clusters(map(_serialize_cluster, clusters), stats)
+        return
+    with Pool(jobs) as pool:
+        # imap hands results back in order however the workers finish
+        yield from _timed_clusters(pool.imap(_serialize_cluster, clusters, chunksize=4), stats)
+
+
+def _timed_clusters(patterns, stats):
+    # only time spent waiting on a pattern counts, not what the caller does with it
+    while True:
+        start = time.perf_counter()
+        pattern = next(patterns, None)
+        stats.add_time('relax+serialize', time.perf_counter() - start)
+        if pattern is None:
+            return
+        stats.count('clusters')
+        stats.count('pattern length', len(pattern))
+        yield pattern
+
+
+def _serialize_cluster(cluster):
+    prefix, suffix_tree = cluster
+    d = DAWG.from_dawg(suffix_tree)
+    # the prefix is literal text; escaped, a pattern only matches strings under it
+    return escape(prefix) + DAWGRelaxer(d).relax().serialize()
+
+
+def _counted(strings, stats):
+    # pass strings through, recording how many there were once they run out
+    n = 0
+    try:
+        for s in strings:
+            n += 1
+            yield s
+    finally:
+        stats.set('strings', n)
+
+
+def _sharder(sample, jobs, tokenizer):
+    '''
+    return a function picking the shard for a string
+    '''
+    if tokenizer is not None:
+        return lambda s: ord(s[0]) % jobs if s else 0
+    # cut past what the sample shares, e.g. 'https://', and on until no one prefix
+    # holds so much of the sample that hashing can't spread it evenly
+    cut = len(commonprefix(sample)) + 1
+    longest = max(map(len, sample), default=0)
+    while cut < longest and max(Counter(s[:cut] for s in sample).values()) * 16 * jobs > len(sample):
+        cut += 1
+    return lambda s: hash(s[:cut]) % jobs
+
+
+def _trie_size(d, memo):
+    # nodes under d in the character trie it was built from, one per character or end
+    size = memo.get(id(d))
+    if size is None:
+        size = memo[id(d)] = sum(len(k) + (_trie_size(v, memo) if k else 1) for k, v in d.items())
+    return size
+
+
+def _build_shard(inbox, results, tokenizer):
+    # a worker that fails still answers, or the parent would wait for it forever
+    try:
+        strings = chain.from_iterable(iter(inbox.get, None))
+        trie = Trie.from_stream(strings, tokenizer=tokenizer)
+        results.put(('root', DAWG.from_trie(trie).dawg, len(trie)))
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(repr(e))
+        results.put(('error', e, traceback.format_exc()))
+        # keep emptying the inbox so the parent never blocks feeding it
+        for _ in iter(inbox.get, None):
+            pass
+
+
+class ShardError(Exception):
+
+    '''
+    carries the traceback of an exception raised in a from_sharded worker
+    '''
+
+    def __str__(self):
+        return '\n' + self.args[0]
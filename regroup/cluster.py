@@ -1,3 +1,11 @@
+from array import array
+from bisect import bisect_left
+from itertools import repeat
+from multiprocessing import Pool
+from operator import add, itemgetter
+import re
+
+from .distance import levenshtein, levenshtein_many
 
 
 class Cluster:
@@ -42,37 +50,94 @@ class Cluster:
         if self.dist <= dist:
             return list(self.leaves())
         else:
-            return (self.left.clusters_by(dist),
-                    self.right.clusters_by(dist))
-    def add(self, clusters, grid, lefti, righti):
-        self.left = clusters[lefti]
-        self.right = clusters[righti]
-        self.dist = sorted(grid[lefti])[1]
-        # merge columns grid[row][righti] and row grid[righti] into corresponding lefti
-        for r in grid:
-            r[lefti] = min(r[lefti], r.pop(righti))
-        grid[lefti] = list(map(min, zip(grid[lefti], grid.pop(righti))))
-        clusters.pop(righti)
-        return (clusters, grid)
+            return tuple(c.clusters_by(dist) if isinstance(c, Cluster) else [c]
+                         for c in (self.left, self.right))
+
+
+def condensed_index(n, i, j):
+    """
+    position of the distance between i and j (i < j) in a condensed array:
+    the upper triangle of an n x n distance matrix, row by row
+    """
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def condense(grid):
+    """
+    convert a full 2-D grid of distances to condensed form
+    """
+    n = len(grid)
+    return [grid[i][j] for i in range(n) for j in range(i + 1, n)]
+
+
+def linkage(dist, n):
+    """
+    single-linkage hierarchy of n items from a condensed distance array, in O(n^2):
+    build a minimum spanning tree with Prim's algorithm, then replay its edges by
+    increasing distance. returns scipy-style rows (a, b, distance, size) where ids
+    below n are items and id n+k is the cluster made by row k; a is whichever side
+    holds the lowest-numbered item
+    ref: Mullner, "Modern hierarchical, agglomerative clustering algorithms"
+    """
+    if n < 2:
+        return []
+    # condensed_index(n, i, j) == offsets[i] + j
+    offsets = [n * i - i * (i + 1) // 2 - i - 1 for i in range(n)]
+    remaining = list(range(1, n))
+    best = [float('inf')] * (n - 1)
+    current = 0
+    edges = []
+    for _ in range(n - 1):
+        # gather current's distances to every remaining item without a python-level loop
+        k = bisect_left(remaining, current)
+        index = list(map(add, map(offsets.__getitem__, remaining[:k]), repeat(current, k)))
+        index += map(add, repeat(offsets[current]), remaining[k:])
+        row = itemgetter(*index)(dist) if len(index) > 1 else [dist[index[0]]]
+        best = [b if b < d else d for b, d in zip(best, row)]
+        k = best.index(min(best))
+        # the item added just before is a valid partner: whenever it is not the nearest,
+        # both already sit in one cluster by the time this edge is replayed
+        edges.append((best.pop(k), current, remaining.pop(k)))
+        current = edges[-1][2]
+    # stable sort keeps Prim order between equal distances
+    edges.sort(key=lambda e: e[0])
+    parent = list(range(n))
+    cluster = list(range(n))  # union-find root -> cluster id
+    size = [1] * n
+    rows = []
+    for d, x, y in edges:
+        x, y = _find(parent, x), _find(parent, y)
+        if y < x:
+            x, y = y, x
+        rows.append((cluster[x], cluster[y], d, size[x] + size[y]))
+        # roots are the lowest item of their cluster, which keeps the left side ordered
+        parent[y] = x
+        size[x] += size[y]
+        cluster[x] = n + len(rows) - 1
+    return rows
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
 
 
 def agglomerate(labels, grid):
     """
-    given a list of labels and a 2-D grid of distances, iteratively agglomerate
-    hierarchical Cluster
+    given a list of labels and distances, either a 2-D grid or condensed, build a
+    single-linkage hierarchical Cluster
     """
-    clusters = labels
-    while len(clusters) > 1:
-        # find 2 closest clusters
-        # print(clusters)
-        distances = [(1, 0, grid[1][0])]
-        for i, row in enumerate(grid[2:]):
-            distances += [(i + 2, j, c) for j, c in enumerate(row[:i+2])]
-        j, i, _ = min(distances, key=lambda x: x[2])
-        # merge i<-j
+    if grid and isinstance(grid[0], (list, tuple)):
+        grid = condense(grid)
+    clusters = list(labels)
+    for a, b, dist, _ in linkage(grid, len(labels)):
         c = Cluster()
-        clusters, grid = c.add(clusters, grid, i, j)
-        clusters[i] = c
+        c.left = clusters[a]
+        c.right = clusters[b]
+        c.dist = dist
+        clusters.append(c)
     return clusters.pop()
 
 
@@ -88,19 +153,70 @@ def strdist2(x, y, toks):
 
 
 def tokenize(w):
-    return re.findall('[a-z]+|[A-Z]+|\d|.', w)
+    return re.findall(r'[a-z]+|[A-Z]+|\d|.', w)
     
 
-def cluster_input(l):
+def distance_matrix(strings, jobs=1):
+    """
+    condensed edit distances between every pair of strings, as an array
+    with jobs > 1, blocks of rows are computed by a pool of worker processes
+    """
+    strings = list(strings)
+    blocks = _row_blocks(len(strings), jobs * 4)
+    dist = array('l')
+    if jobs <= 1 or len(blocks) <= 1:
+        _init_worker(strings)
+        for block in blocks:
+            dist.extend(_distance_rows(block))
+        return dist
+    with Pool(jobs, initializer=_init_worker, initargs=(strings,)) as pool:
+        # imap hands blocks back in order, so they concatenate straight into place
+        for rows in pool.imap(_distance_rows, blocks):
+            dist.extend(rows)
+    return dist
+
+
+def _row_blocks(n, count):
+    """
+    split rows 0..n-1 into at most count runs holding about the same number of pairs;
+    row i pairs with the n-1-i strings after it
+    """
+    total = n * (n - 1) // 2
+    blocks = []
+    lo = 0
+    pairs = 0
+    for i in range(n - 1):
+        pairs += n - 1 - i
+        if pairs * count >= total * (len(blocks) + 1):
+            blocks.append((lo, i + 1))
+            lo = i + 1
+    if lo < n - 1:
+        blocks.append((lo, n - 1))
+    return blocks
+
+
+_strings = None
+
+
+def _init_worker(strings):
+    global _strings
+    _strings = strings
+
+
+def _distance_rows(block):
+    lo, hi = block
+    rows = array('l')
+    for i in range(lo, hi):
+        rows.extend(levenshtein_many(_strings[i], _strings[i + 1:]))
+    return rows
+
+
+def cluster_input(l, jobs=1):
 
     # tokens = {w: tokenize(w) for w in l}
     # pprint(tokens)
 
-    dist = []
-    for i, x in enumerate(l):
-        d = [strdist(x, y)
-                for j, y in enumerate(l)]
-        dist.append(d)
+    dist = distance_matrix(l, jobs=jobs)
 
     clusters = agglomerate(l, dist)
     distances = list(clusters.distances())
@@ -0,0 +1,74 @@
+# vim: set ts=4 et:
+
+'''
+string edit distance
+ref: https://en.wikipedia.org/wiki/Levenshtein_distance
+'''
+
+
+def levenshtein(x, y, bound=None):
+    '''
+    edit distance between x and y
+    with a bound, give up as soon as the distance must exceed it and return bound + 1
+    '''
+    if len(x) < len(y):
+        x, y = y, x
+    return _myers(_pattern(y), len(y), x, bound)
+
+
+def levenshtein_many(x, strings, bound=None):
+    '''
+    edit distances from x to each of strings, as a list; x is only prepared once,
+    which makes this the cheap way to fill a row of a distance matrix
+    '''
+    pattern = _pattern(x)
+    m = len(x)
+    return [_myers(pattern, m, y, bound) for y in strings]
+
+
+def _pattern(p):
+    # bitmask of the positions in p where each character occurs
+    peq = {}
+    for i, c in enumerate(p):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+def _myers(peq, m, text, bound):
+    '''
+    Myers' bit-vector algorithm as reformulated by Hyyro: each column of the edit
+    distance table is held as vertical +1/-1 deltas in two integers, so a step
+    costs a handful of integer operations instead of a loop over the pattern
+    ref: Hyyro, "Explaining and Extending the Bit-parallel Approximate String Matching
+         Algorithm of Myers"
+    '''
+    n = len(text)
+    if bound is not None and abs(m - n) > bound:
+        return bound + 1
+    if not m:
+        return n
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp = mask
+    vn = 0
+    score = m
+    for j, c in enumerate(text):
+        eq = peq.get(c, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | (~(xh | vp) & mask)
+        hn = vp & xh
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        # each remaining character can lower the score by at most one
+        if bound is not None and score - (n - j - 1) > bound:
+            return bound + 1
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(xv | hp) & mask)
+        vn = hp & xv
+    if bound is not None and score > bound:
+        return bound + 1
+    return score
@@ -0,0 +1,91 @@
+# vim: set ts=4 et:
+
+'''
+external sort: order and dedupe more strings than fit in memory
+ref: https://en.wikipedia.org/wiki/External_sorting
+'''
+
+from heapq import merge
+from itertools import islice
+import pickle
+import tempfile
+
+
+def sorted_unique(strings, run_size=1000000, tmpdir=None, key=None, fan_in=100):
+    '''
+    yield the distinct strings in sorted order, by key if given
+    up to run_size distinct strings are held at once; each full set is sorted into a
+    temporary run file, and the runs are merged lazily at the end.
+    at most fan_in runs are ever merged, or kept, at once: every fan_in runs are merged
+    into one longer run as they fill up, so open files stay bounded however long the input
+    '''
+    opened = []
+    levels = []  # levels[i] holds runs each merged from fan_in ** i sorted sets
+
+    def add(run, level=0):
+        while True:
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(run)
+            if len(levels[level]) < fan_in:
+                return
+            group, levels[level] = levels[level], []
+            run = _write_run(_merged(group, key), tmpdir, opened)
+            for f in group:
+                f.close()
+            level += 1
+
+    try:
+        buf = set()
+        for s in strings:
+            buf.add(s)
+            if len(buf) >= run_size:
+                add(_write_run(sorted(buf, key=key), tmpdir, opened))
+                buf = set()
+        if not levels:
+            # everything fit; no need to touch the disk
+            yield from sorted(buf, key=key)
+            return
+        if buf:
+            add(_write_run(sorted(buf, key=key), tmpdir, opened))
+        buf = None
+        runs = [run for level in levels for run in level]
+        while len(runs) > fan_in:
+            group, runs = runs[:fan_in], runs[fan_in:]
+            runs.append(_write_run(_merged(group, key), tmpdir, opened))
+            for f in group:
+                f.close()
+        yield from _merged(runs, key)
+    finally:
+        for f in opened:
+            f.close()
+
+
+def _merged(runs, key):
+    # the same string may sit in several runs, but merged they are adjacent
+    prev = None
+    for s in merge(*map(_read_run, runs), key=key):
+        if s != prev:
+            yield s
+            prev = s
+
+
+def _write_run(strings, tmpdir, opened, chunk=10000):
+    f = tempfile.TemporaryFile(dir=tmpdir)
+    opened.append(f)
+    strings = iter(strings)
+    while True:
+        block = list(islice(strings, chunk))
+        if not block:
+            break
+        pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    while True:
+        try:
+            yield from pickle.load(f)
+        except EOFError:
+            return
@@ -0,0 +1,104 @@
+# vim: set ts=4 et:
+
+from .storage import MappedNode
+
+
+class NodePool:
+
+    '''
+    hash-consing pool of DAWG subtrees
+    structurally equal subtrees are interned to one canonical dict, so comparing
+    interned subtrees is an identity check and id() doubles as their hash.
+    canonical dicts are shared between parents and must never be modified.
+    nodes of a loaded DAWG are already canonical and are used in place
+    '''
+
+    def __init__(self):
+        self.nodes = {}       # signature -> canonical node
+        self.signatures = {}  # id(canonical node) -> signature
+        # per-node results that depend only on structure, filled in by regroup.relax
+        self.sizes = {}       # id(node) -> dict_count_recursive
+        self.diffs = {}       # (id(node), id(node)) -> dict_diff_recursive
+        self.merges = {}      # (id(node), id(node)) -> dict_merge
+        # bumped whenever compact drops nodes, whose ids may then be reused
+        self.generation = 0
+        self.empty = self.intern({})
+        self.end = self.intern({'': {}})
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, d):
+        return id(d) in self.signatures
+
+    def intern(self, d):
+        '''
+        return the canonical node structurally equal to d
+        '''
+        return self._intern(d, {})
+
+    def _intern(self, d, memo):
+        if id(d) in self.signatures:
+            return d
+        if isinstance(d, MappedNode):
+            return self._mapped(d)
+        node = memo.get(id(d))
+        if node is None:
+            node = memo[id(d)] = self.canonical({k: self._intern(v, memo) for k, v in d.items()})
+        return node
+
+    def _mapped(self, d):
+        # a saved graph holds each node once and its store keeps one view per node, so
+        # a view is canonical as it stands and is used in place, not copied; only the
+        # leaves are swapped for the pool's own, which callers test for by identity
+        n = len(d)
+        if n == 1 and not d.get('', True):
+            return self.end
+        return d if n else self.empty
+
+    def canonical(self, d):
+        '''
+        return the canonical node for d, whose children are all canonical already;
+        what intern does once the children are done, for callers that build bottom-up.
+        d may become the canonical node itself, so it must not be changed after
+        '''
+        if len(d) > 1:
+            # keep canonical keys sorted so a node looks the same however it was first reached
+            d = {k: d[k] for k in sorted(d)}
+        # children are canonical, so their identity stands in for their whole structure
+        signature = tuple([(k, id(v)) for k, v in d.items()])
+        node = self.nodes.get(signature)
+        if node is None:
+            node = self.nodes[signature] = d
+            self.signatures[id(node)] = signature
+        return node
+
+    def compact(self, roots):
+        '''
+        drop every node not reachable from the canonical roots, along with the results
+        above that name one; return the ids of the nodes kept.
+        a dropped node's id can be reused once it is freed, so callers caching by id
+        must prune to the kept ids, or start over when generation changes
+        '''
+        keep = {}
+        todo = [self.empty, self.end] + list(roots)
+        while todo:
+            node = todo.pop()
+            if id(node) not in keep:
+                keep[id(node)] = node
+                todo.extend(node.values())
+        # loaded nodes are walked through but were never pooled
+        self.signatures = {i: self.signatures[i] for i in keep if i in self.signatures}
+        self.nodes = {sig: keep[i] for i, sig in self.signatures.items()}
+        self.sizes = {i: n for i, n in self.sizes.items() if i in keep}
+        self.diffs = {k: n for k, n in self.diffs.items() if k[0] in keep and k[1] in keep}
+        self.merges = {k: v for k, v in self.merges.items()
+                       if k[0] in keep and k[1] in keep and id(v) in keep}
+        self.generation += 1
+        return keep.keys()
+
+    def emptyish(self, node):
+        '''collapse empty strings'''
+        if node is self.end:
+            return self.empty
+        return node
@@ -1,17 +1,22 @@
-
 from functools import reduce
 
+from .pool import NodePool
+
 
-def dict_merge(a, b, path=None):
+def dict_merge(a, b, path=None, pool=None):
+    if pool is not None:
+        return _pooled_merge(pool.intern(a), pool.intern(b), pool)
     return _dict_merge(a, b, [])
 
 
 def _dict_merge(a, b, path=None):
+    # NOTE: never modify a or b in place; DAWG subtrees may be shared between several parents
+    a = dict(a)
     for key, vb in b.items():
         va = a.get(key)
         if va:
             if isinstance(va, dict) and isinstance(vb, dict):
-                _dict_merge(va, vb, path + [str(key)])
+                a[key] = _dict_merge(va, vb, path + [str(key)])
             elif va == vb:
                 pass  # same leaf value
             else:
@@ -21,12 +26,49 @@ def _dict_merge(a, b, path=None):
     return a
 
 
-def dict_count_recursive(d):
+def _pooled_merge(a, b, pool):
+    # same result as _dict_merge, over interned nodes, remembered per pair
+    if a is b or not b:
+        return a
+    if not a:
+        return b
+    key = (id(a), id(b))
+    merged = pool.merges.get(key)
+    if merged is None:
+        merged = dict(a)
+        for k, vb in b.items():
+            va = merged.get(k)
+            merged[k] = _pooled_merge(va, vb, pool) if va else vb
+        merged = pool.merges[key] = pool.intern(merged)
+    return merged
+
+
+def dict_count_recursive(d, pool=None):
+    if pool is not None:
+        return _pooled_count(pool.intern(d), pool)
     return sum(1 + dict_count_recursive(v)
                for k, v in d.items()) if d else 0
 
 
-def dict_diff_recursive(d1, d2):
+def _pooled_count(d, pool):
+    size = pool.sizes.get(id(d))
+    if size is None:
+        size = pool.sizes[id(d)] = sum(1 + _pooled_count(v, pool) for v in d.values())
+    return size
+
+
+def dict_diff_recursive(d1, d2, pool=None, limit=None):
+    '''
+    count the members found in only one of d1 and d2
+    with a pool, subtree sizes and diffs are remembered per pair of interned nodes;
+    with a limit, stop as soon as the count exceeds it and return the partial count
+    '''
+    if pool is not None:
+        return _pooled_diff(d1 if d1 is None else pool.intern(d1),
+                            d2 if d2 is None else pool.intern(d2),
+                            pool, limit)
+    if d1 is d2:
+        return 0
     if d1 is None:
         return dict_count_recursive(d2)
     if d2 is None:
@@ -36,9 +78,44 @@ def dict_diff_recursive(d1, d2):
          sum(dict_diff_recursive(v2, d1.get(k2)) for k2, v2 in d2.items()))
 
 
-def suffixes_diff(d):
-    dv = list(d.values())
-    merged = reduce(dict_merge, dv, {})
+def _pooled_diff(d1, d2, pool, limit):
+    if d1 is d2:
+        return 0
+    if d1 is None:
+        return _pooled_count(d2, pool)
+    if d2 is None:
+        return _pooled_count(d1, pool)
+    # the diff is symmetric, so one entry serves both orders
+    key = (id(d1), id(d2)) if id(d1) < id(d2) else (id(d2), id(d1))
+    diff = pool.diffs.get(key)
+    if diff is not None:
+        return diff
+    diff = 0
+    for a, b in ((d1, d2), (d2, d1)):
+        for k, v in a.items():
+            diff += _pooled_diff(v, b.get(k), pool,
+                                 None if limit is None else limit - diff)
+            if limit is not None and diff > limit:
+                # partial count; only exact counts are remembered
+                return diff
+    pool.diffs[key] = diff
+    return diff
+
+
+def suffixes_diff(d, pool=None, limit=None):
+    '''
+    count how far the children of d are from their merged union
+    with a limit the count may stop early at any value over limit
+    '''
+    pool = pool or NodePool()
+    dv = [pool.intern(v) for v in d.values()]
+    if len(set(map(id, dv))) <= 1:
+        return 0
+    merged = reduce(lambda a, b: _pooled_merge(a, b, pool), dv, pool.empty)
     # print('merged', merged)
-    return sum(dict_diff_recursive(x, merged)
-               for x in dv)
+    diff = 0
+    for x in dv:
+        diff += _pooled_diff(x, merged, pool, None if limit is None else limit - diff)
+        if limit is not None and diff > limit:
+            break
+    return diff
@@ -0,0 +1,62 @@
+# vim: set ts=4 et:
+
+from contextlib import contextmanager
+import time
+
+
+class Stats:
+
+    '''
+    wall time per pipeline stage plus sizes observed along the way
+    pass one as stats= to the building/relaxing/serializing calls to fill it in;
+    timings and counts are plain dicts in the order things happened
+    '''
+
+    def __init__(self):
+        self.timings = {}  # stage -> seconds
+        self.counts = {}   # name -> int
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def set(self, name, n):
+        self.counts[name] = n
+
+    def as_dict(self):
+        return {'timings': dict(self.timings), 'counts': dict(self.counts)}
+
+    def __repr__(self):
+        return 'Stats({!r})'.format(self.as_dict())
+
+    def __str__(self):
+        lines = ['{:<20} {:>10.3f}s'.format(k, v) for k, v in self.timings.items()]
+        lines += ['{:<20} {:>11}'.format(k, v) for k, v in self.counts.items()]
+        return '\n'.join(lines)
+
+
+def dawg_size(d):
+    '''
+    (nodes, edges) of the graph below d, counting each shared node once
+    '''
+    seen = set()
+    edges = 0
+    todo = [d]
+    while todo:
+        node = todo.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        edges += len(node)
+        todo.extend(node.values())
+    return len(seen), edges
@@ -0,0 +1,180 @@
+# vim: set ts=4 et:
+
+'''
+compact binary DAWG files, loaded through mmap
+
+layout, every table an array of native unsigned ints so it maps in place:
+    header      magic, byte order, label/node/edge counts
+    offsets     labels + 1 offsets into the label blob
+    first       nodes + 1 offsets into the edge tables; node i owns edges first[i]:first[i+1]
+    elabel      label index of each edge
+    etarget     node index each edge leads to
+    blob        utf-8 labels, each stored once
+node 0 is the root
+'''
+
+from array import array
+from collections.abc import Mapping
+import mmap
+import os
+from pprint import pformat
+import struct
+import sys
+
+MAGIC = b'RGDAWG\x00\x01'
+HEADER = struct.Struct('=8sIIII')  # magic, little endian?, labels, nodes, edges
+LITTLE = sys.byteorder == 'little'
+
+
+def save(root, fp):
+    '''
+    write the graph below root to the binary file fp, each shared node once
+    '''
+    index = {id(root): 0}
+    nodes = [root]
+    labels = {}
+    first = array('I', [0])
+    elabel = array('I')
+    etarget = array('I')
+    # nodes grows as new children are numbered, so this walks the whole graph
+    for node in nodes:
+        for k, v in node.items():
+            if not isinstance(k, str):
+                raise TypeError('only string labels can be saved: {!r}'.format(k))
+            if id(v) not in index:
+                index[id(v)] = len(nodes)
+                nodes.append(v)
+            elabel.append(labels.setdefault(k, len(labels)))
+            etarget.append(index[id(v)])
+        first.append(len(etarget))
+    encoded = [k.encode('utf-8') for k in labels]
+    offsets = array('I', [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    fp.write(HEADER.pack(MAGIC, LITTLE, len(labels), len(nodes), len(etarget)))
+    for a in (offsets, first, elabel, etarget):
+        a.tofile(fp)
+    fp.write(b''.join(encoded))
+
+
+class Store:
+
+    '''
+    a saved DAWG mapped read-only into memory
+    nothing is decoded up front: labels and node views are made on first use and kept,
+    so a node is always the same view object and can be told apart by identity
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, little, nlabels, nnodes, nedges = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError('not a DAWG file: {}'.format(path))
+        if bool(little) != LITTLE:
+            raise ValueError('DAWG file saved with the other byte order: {}'.format(path))
+        view = memoryview(self.mm)
+        pos = HEADER.size
+        tables = []
+        for n in (nlabels + 1, nnodes + 1, nedges, nedges):
+            size = n * array('I').itemsize
+            tables.append(view[pos:pos + size].cast('I'))
+            pos += size
+        self.offsets, self.first, self.elabel, self.etarget = tables
+        self.blob = view[pos:]
+        self.labels = {}
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.first) - 1
+
+    def root(self):
+        return self.node(0)
+
+    def node(self, i):
+        n = self.nodes.get(i)
+        if n is None:
+            n = self.nodes[i] = MappedNode(self, i)
+        return n
+
+    def label(self, i):
+        s = self.labels.get(i)
+        if s is None:
+            s = self.labels[i] = str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+        return s
+
+
+class MappedNode(Mapping):
+
+    '''
+    read-only dict-like view of one node in a Store
+    '''
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def _edges(self):
+        return range(self.store.first[self.index], self.store.first[self.index + 1])
+
+    def __len__(self):
+        first = self.store.first
+        return first[self.index + 1] - first[self.index]
+
+    def __iter__(self):
+        store = self.store
+        return (store.label(store.elabel[e]) for e in self._edges())
+
+    def __getitem__(self, key):
+        node = self.get(key)
+        if node is None:
+            raise KeyError(key)
+        return node
+
+    def get(self, key, default=None):
+        # Mapping's get and in go through a raised KeyError, which misses often
+        store = self.store
+        for e in self._edges():
+            if store.label(store.elabel[e]) == key:
+                return store.node(store.etarget[e])
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def items(self):
+        store = self.store
+        for e in self._edges():
+            yield store.label(store.elabel[e]), store.node(store.etarget[e])
+
+    def values(self):
+        store = self.store
+        for e in self._edges():
+            yield store.node(store.etarget[e])
+
+    def as_dict(self, memo=None):
+        memo = {} if memo is None else memo
+        if self.index not in memo:
+            memo[self.index] = {k: v.as_dict(memo) for k, v in self.items()}
+        return memo[self.index]
+
+    def __repr__(self):
+        return pformat(self.as_dict())
+
+    def __reduce__(self):
+        # send where the node is rather than the subgraph below it;
+        # the receiving process maps the file for itself
+        return (_node, (self.store.path, self.index))
+
+
+_opened = {}  # path -> Store, for nodes unpickled in this process
+
+
+def _node(path, index):
+    store = _opened.get(path)
+    if store is None:
+        store = _opened[path] = Store(path)
+    return store.node(index)
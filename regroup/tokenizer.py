@@ -1,6 +1,5 @@
 # vim: set ts=4 et:
 
-from collections import defaultdict
 import re
 
 
@@ -14,6 +13,11 @@ def tokenize_regex_case_sensitive(string):
         yield token
 
 
+_fallback = re.compile(r'[a-z]+|[A-Z]+|\d+|\s+|.')
+# regex syntax that looks at text before the match, which used to be cut off
+_context = ('^', r'\A', r'\b', r'\B', '(?<')
+
+
 class Tokenizer:
 
     def __init__(self):
@@ -25,31 +29,54 @@ class Tokenizer:
 
 class DictionaryTokenizer(Tokenizer):
 
-    def __init__(self, wordset=None):
+    '''
+    split strings into dictionary words, falling back to runs of letters/digits/spaces
+    words live in a character trie built once, so finding the next token walks at most
+    the length of the longest matching word; longest=False takes the shortest word instead
+    '''
+
+    def __init__(self, wordset=None, longest=True):
         wordset = set(wordset) if wordset else set()
         self.wordset = wordset
-        self.wordsetlen = defaultdict(set)
+        self.longest = longest
+        self.trie = {}
         for w in self.wordset:
-            self.wordsetlen[len(w)].add(w)
+            if w:
+                d = self.trie
+                for c in w:
+                    d = d.setdefault(c, {})
+                d[''] = {}  # denote end-of-word
 
     def tokenize(self, string):
-        matchstring = string
-        while matchstring:
-            nexttoken = self.nexttoken(matchstring)
-            yield string[:len(nexttoken)]
-            matchstring = matchstring[len(nexttoken):]
-            string = string[len(nexttoken):]
+        pos = 0
+        while pos < len(string):
+            end = self.match(string, pos)
+            yield string[pos:end]
+            pos = end
 
     def nexttoken(self, substr):
-        longest = ''
-        for length, words in sorted(self.wordsetlen.items()):
-            for word in words:
-                if substr.startswith(word):
-                    longest = word
+        return substr[:self.match(substr, 0)]
+
+    def match(self, string, pos):
+        '''
+        return the end of the token starting at string[pos]
+        '''
+        d = self.trie
+        end = 0
+        i = pos
+        while i < len(string):
+            d = d.get(string[i])
+            if d is None:
+                break
+            i += 1
+            if '' in d:
+                end = i
+                if not self.longest:
                     break
-        if not longest:
-            return self.fallback(substr)
-        return longest
+        if not end:
+            m = _fallback.match(string, pos)
+            end = m.end() if m else pos + 1
+        return end
 
     def fallback(self, string):
         m = re.search('^([a-z]+|[A-Z]+|\d+|\s+|.)', string)
@@ -58,38 +85,149 @@ class DictionaryTokenizer(Tokenizer):
         return string[0]
 
 
-class Tagged:
+class Tagged(tuple):
 
-    def __init__(self, string, tag):
-        self.string = string
-        self.tag = tag
+    '''
+    a (string, tag) token; TaggingTokenizer interns them so equal tokens are one object
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, string, tag):
+        return tuple.__new__(cls, (string, tag))
+
+    @property
+    def string(self):
+        return self[0]
+
+    @property
+    def tag(self):
+        return self[1]
 
     def __str__(self):
         return self.string
 
 
+class TagClass:
+
+    '''
+    trie/DAWG edge label standing for tokens with one tag at that position.
+    a trie edge holds the one token it was built from; building the DAWG merges the
+    members of classes whose subtrees are the same. members must not change once the
+    label is in a dict, since equality and hashing depend on them
+    '''
+
+    __slots__ = ('tag', 'members')
+
+    def __init__(self, tag, members=()):
+        self.tag = tag
+        self.members = set(members)
+
+    def _key(self):
+        return (self.tag, sorted(self.members))
+
+    def __eq__(self, other):
+        return isinstance(other, TagClass) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash((self.tag, frozenset(self.members)))
+
+    # strings sort before tag classes, so nodes mixing the two still have a key order
+    def __lt__(self, other):
+        if isinstance(other, TagClass):
+            return self._key() < other._key()
+        return False
+
+    def __gt__(self, other):
+        if isinstance(other, TagClass):
+            return self._key() > other._key()
+        return True
+
+    def __str__(self):
+        members = sorted(self.members)
+        if len(members) == 1:
+            return members[0]
+        return '[' + ','.join(members) + ']'
+
+    def __repr__(self):
+        return 'TagClass({!r}, {!r})'.format(self.tag, sorted(self.members))
+
+
 class TaggingTokenizer:
 
+    '''
+    split strings into (token, tag) pairs, where tags maps a tag name to either a set
+    of literal strings or a compiled regex. at each position the longest match of any
+    tag wins, the earlier tag on a tie; untagged text falls back to letter/digit runs.
+    tags are compiled once: every literal goes into one character trie and regexes
+    are matched anchored at the position, so tokenizing rarely re-slices the string.
+    a regex with anchors, word boundaries or lookbehinds is still matched against the
+    rest of the string, so it sees each token's start as the start of the text
+    '''
+
     def __init__(self, tags):
         self.tags = tags
+        self.interned = {}
+        self.trie = {}
+        self.patterns = []
+        for index, (tagname, tagdef) in enumerate(tags.items()):
+            if isinstance(tagdef, (list, set)):
+                for t in tagdef:
+                    if t:
+                        d = self.trie
+                        for c in t:
+                            d = d.setdefault(c, {})
+                        # the earliest tag holding a literal claims it
+                        d.setdefault('', (index, tagname))
+            else:
+                sliced = any(c in tagdef.pattern for c in _context)
+                self.patterns.append((index, tagname, tagdef, sliced))
 
     def tokenize(self, string):
-        matchstring = string
-        while matchstring:
-            nexttoken, nexttag = self.nexttoken(matchstring)
-            yield (nexttoken, nexttag)
-            matchstring = matchstring[len(nexttoken):]
-            string = string[len(nexttoken):]
+        pos = 0
+        while pos < len(string):
+            end, tag = self.match(string, pos)
+            yield self.token(string[pos:end], tag)
+            pos = end
 
     def nexttoken(self, substr):
-        longest = ('', '')
-        for tagname, tagdef in self.tags.items():
-            match = self.tagmatch(substr, tagdef)
-            if match and len(match) > len(longest[0]):
-                longest = (match, tagname)
-        if not longest[0]:
-            longest = (self.fallback(substr), None)
-        return longest
+        end, tag = self.match(substr, 0)
+        return self.token(substr[:end], tag)
+
+    def token(self, string, tag):
+        t = self.interned.get((string, tag))
+        if t is None:
+            t = self.interned[(string, tag)] = Tagged(string, tag)
+        return t
+
+    def match(self, string, pos):
+        '''
+        return (end, tag) of the token starting at string[pos]
+        '''
+        best = (pos, None, None)  # (end, tag index, tag name)
+        d = self.trie
+        i = pos
+        while i < len(string):
+            d = d.get(string[i])
+            if d is None:
+                break
+            i += 1
+            if '' in d:
+                # each literal ends further along than the last
+                best = (i,) + d['']
+        for index, tagname, tagdef, sliced in self.patterns:
+            if sliced:
+                m = tagdef.match(string[pos:])
+                end = m and pos + m.end()
+            else:
+                m = tagdef.match(string, pos)
+                end = m and m.end()
+            if m and (end > best[0] or (end == best[0] > pos and index < best[1])):
+                best = (end, index, tagname)
+        if best[0] == pos:
+            m = _fallback.match(string, pos)
+            return (m.end() if m else pos + 1, None)
+        return (best[0], best[2])
 
     def tagmatch(self, substr, tagdef):
         if isinstance(tagdef, (list, set)):
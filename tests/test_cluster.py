@@ -0,0 +1,103 @@
+
+import random
+import unittest
+
+from regroup.cluster import Cluster, agglomerate, condense, condensed_index, distance_matrix, linkage
+from regroup.distance import levenshtein
+
+
+def naive_single_linkage(n, dist):
+    '''merge the two closest clusters until one is left; returns merge distances'''
+    clusters = [{i} for i in range(n)]
+    merged = []
+    while len(clusters) > 1:
+        d, a, b = min((min(dist(x, y) for x in ca for y in cb), a, b)
+                      for a, ca in enumerate(clusters)
+                      for b, cb in enumerate(clusters) if a < b)
+        merged.append((d, clusters[a] | clusters[b]))
+        clusters[a] |= clusters.pop(b)
+    return merged
+
+
+class TestLinkage(unittest.TestCase):
+
+    def grid(self, n, values):
+        grid = [[0] * n for _ in range(n)]
+        values = iter(values)
+        for i in range(n):
+            for j in range(i + 1, n):
+                grid[i][j] = grid[j][i] = next(values)
+        return grid
+
+    def test_condense(self):
+        grid = self.grid(4, range(1, 7))
+        dist = condense(grid)
+        self.assertEqual([1, 2, 3, 4, 5, 6], dist)
+        self.assertEqual(grid[1][3], dist[condensed_index(4, 1, 3)])
+
+    def test_tree(self):
+        labels = ['a', 'b', 'c', 'd']
+        #     a  b  c  d
+        # a   0  1  5  9
+        # b      0  4  8
+        # c         0  2
+        grid = self.grid(4, [1, 5, 9, 4, 8, 2])
+        self.assertEqual([(0, 1, 1, 2), (2, 3, 2, 2), (4, 5, 4, 4)],
+                         linkage(condense(grid), 4))
+        c = agglomerate(labels, grid)
+        self.assertIsInstance(c, Cluster)
+        self.assertEqual('((a 1 b) 4 (c 2 d))', repr(c))
+        self.assertEqual(labels, ['a', 'b', 'c', 'd'])
+
+    def test_condensed_input(self):
+        grid = self.grid(3, [3, 1, 2])
+        self.assertEqual(repr(agglomerate(['x', 'y', 'z'], grid)),
+                         repr(agglomerate(['x', 'y', 'z'], condense(grid))))
+
+    def test_single(self):
+        self.assertEqual('a', agglomerate(['a'], [[0]]))
+
+    def test_naive(self):
+        rand = random.Random(0)
+        for _ in range(50):
+            n = rand.randint(2, 12)
+            grid = self.grid(n, [rand.randint(0, 5) for _ in range(n * n)])
+            rows = linkage(condense(grid), n)
+            members = [{i} for i in range(n)]
+            for a, b, d, size in rows:
+                members.append(members[a] | members[b])
+                self.assertEqual(size, len(members[-1]))
+            expect = naive_single_linkage(n, lambda x, y: grid[x][y])
+            self.assertEqual([d for d, _ in expect], [d for _, _, d, _ in rows])
+            # equal distances may merge in another order, but the clusters
+            # left once every merge up to a given distance is done must agree
+            for cut in range(6):
+                self.assertEqual(
+                    self.partition(n, [m for d, m in expect if d <= cut]),
+                    self.partition(n, [members[n + k] for k, row in enumerate(rows)
+                                       if row[2] <= cut]))
+
+    def partition(self, n, merges):
+        parts = {i: frozenset([i]) for i in range(n)}
+        for m in merges:
+            for i in m:
+                parts[i] = frozenset(m)
+        return set(parts.values())
+
+
+class TestDistanceMatrix(unittest.TestCase):
+
+    strings = ['EFgreen', 'EFgrey', 'EntireS1', 'EntireS2', 'J27RedP1', 'J27GreenP1', 'J']
+
+    def test_condensed(self):
+        grid = [[levenshtein(x, y) for y in self.strings] for x in self.strings]
+        self.assertEqual(condense(grid), list(distance_matrix(self.strings)))
+
+    def test_jobs(self):
+        self.assertEqual(distance_matrix(self.strings),
+                         distance_matrix(self.strings, jobs=2))
+
+    def test_tiny(self):
+        self.assertEqual([], list(distance_matrix([])))
+        self.assertEqual([], list(distance_matrix(['a'], jobs=2)))
+        self.assertEqual([1], list(distance_matrix(['a', 'b'], jobs=2)))
@@ -0,0 +1,31 @@
+
+import unittest
+
+from regroup.distance import levenshtein, levenshtein_many
+
+
+class TestLevenshtein(unittest.TestCase):
+
+    def test_simple(self):
+        self.assertEqual(0, levenshtein('', ''))
+        self.assertEqual(3, levenshtein('', 'abc'))
+        self.assertEqual(3, levenshtein('kitten', 'sitting'))
+        self.assertEqual(3, levenshtein('sitting', 'kitten'))
+        self.assertEqual(2, levenshtein('EFgreen', 'EFgrey'))
+
+    def test_long(self):
+        # wider than a machine word
+        x = 'ab' * 100
+        self.assertEqual(1, levenshtein(x, x[:-1]))
+        self.assertEqual(100, levenshtein(x, 'a' * 100))
+
+    def test_bound(self):
+        self.assertEqual(3, levenshtein('kitten', 'sitting', bound=3))
+        self.assertEqual(3, levenshtein('kitten', 'sitting', bound=2))
+        self.assertEqual(1, levenshtein('a', 'abcdefgh', bound=0))
+
+    def test_many(self):
+        self.assertEqual([0, 1, 3, 4],
+                         levenshtein_many('abcd', ['abcd', 'abd', 'a', 'wxyz']))
+        self.assertEqual([0, 1, 2, 2],
+                         levenshtein_many('abcd', ['abcd', 'abd', 'a', 'wxyz'], bound=1))
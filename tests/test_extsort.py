@@ -0,0 +1,42 @@
+import random
+import unittest
+
+from regroup import DAWG, DictionaryTokenizer, match
+from regroup.extsort import sorted_unique
+
+
+class TestSortedUnique(unittest.TestCase):
+
+    def test_runs(self):
+        rand = random.Random(0)
+        strings = [str(rand.randint(0, 500)) for _ in range(2000)]
+        for run_size in (1, 7, 100, 10000):
+            self.assertEqual(sorted(set(strings)),
+                             list(sorted_unique(strings, run_size=run_size)))
+
+    def test_fan_in(self):
+        rand = random.Random(0)
+        strings = [str(rand.randint(0, 500)) for _ in range(2000)]
+        for run_size, fan_in in ((1, 2), (3, 2), (7, 5), (50, 3)):
+            self.assertEqual(sorted(set(strings)),
+                             list(sorted_unique(strings, run_size=run_size, fan_in=fan_in)))
+
+    def test_key(self):
+        strings = ['ab', 'ba', 'ca', 'ab']
+        self.assertEqual(['ba', 'ca', 'ab'],
+                         list(sorted_unique(strings, run_size=1, key=lambda s: s[::-1])))
+
+    def test_empty(self):
+        self.assertEqual([], list(sorted_unique([], run_size=1)))
+
+    def test_dawg(self):
+        strings = ['joe', 'joey', 'joes', 'joeseph', 'joe', 'bat', 'brat']
+        self.assertEqual(match(strings),
+                         DAWG.from_external(iter(strings), run_size=2).serialize())
+
+    def test_tokenizer(self):
+        # ['ab', 'c'] sorts before ['abb'] though 'abc' sorts after 'abb'
+        tokenizer = DictionaryTokenizer(['ab', 'abb'])
+        strings = ['abc', 'abb', 'ab']
+        self.assertEqual(DAWG.from_list(strings, tokenizer=tokenizer).serialize(),
+                         DAWG.from_external(strings, run_size=1, tokenizer=tokenizer).serialize())
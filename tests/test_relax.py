@@ -1,7 +1,9 @@
 
+import random
 import unittest
 
-from regroup import DAWG, DAWGRelaxer, suffixes_diff
+from regroup import DAWG, DAWGRelaxer, NodePool, serialize_clusters, suffixes_diff
+from regroup.relax import dict_diff_recursive, dict_merge
 
 
 class TestRelaxer(unittest.TestCase):
@@ -33,9 +35,46 @@ class TestRelaxer(unittest.TestCase):
         self.assertEqual(serial2,
                          '(E(Fgre(en|y)|ntireS[12])|J(27(Green|Red)P[12]|ournalP[12](Bl(ack|ue)|(Green|Red))))')
 
+    def test_same_as_rescan(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            strings = [''.join(rand.choice('abc') for _ in range(rand.randint(0, 5)))
+                       for _ in range(rand.randint(0, 15))]
+            threshold = rand.randint(1, 3)
+            self.assertEqual(
+                DAWGRelaxer(DAWG.from_list(strings)).relax_rescan(threshold).serialize(),
+                DAWGRelaxer(DAWG.from_list(strings)).relax(threshold).serialize(),
+                strings)
+
+    def test_clusters_jobs(self):
+        clusters = DAWG.from_list(self.strings).cluster_by_prefixlen(2)
+        serial = list(serialize_clusters(clusters))
+        self.assertEqual(['EFgre(en|y)', 'EntireS[12]', 'J27(Green|Red)P[12]',
+                          'JournalP[12](Bl(ack|ue)|(Green|Red))'], serial)
+        self.assertEqual(serial, list(serialize_clusters(clusters, jobs=2)))
+
+    def test_clusters_escaped(self):
+        # a pattern is anchored to its literal prefix, so counting under it sees every match
+        clusters = DAWG.from_list(['a.b', 'a.c', 'axd']).cluster_by_prefixlen(2)
+        self.assertEqual([r'a\.[bc]', 'axd'], list(serialize_clusters(clusters)))
+
 
 class TestSuffixes(unittest.TestCase):
 
+    def test_shared_subtrees(self):
+        # merging used to update shared subtrees in place, so one relaxation leaked into
+        # every other parent of the node: this gave (aab|b(ac|c(a|ccb)?)|cc?)?, with bc
+        dawg = DAWGRelaxer(DAWG.from_list(['', 'aab', 'bac', 'bca', 'bcccb', 'c', 'cc'])).relax()
+        self.assertEqual('(aab|b(ac|c(a|ccb))|cc?)?', dawg.serialize())
+        self.assertNotIn('bc', dawg)
+
+    def test_merge_copies(self):
+        a = {'x': {'': {}}}
+        b = {'x': {'y': {'': {}}}}
+        self.assertEqual({'x': {'': {}, 'y': {'': {}}}}, dict_merge(a, b))
+        self.assertEqual({'x': {'': {}}}, a)
+        self.assertEqual({'x': {'y': {'': {}}}}, b)
+
     def test_empty(self):
         self.assertEqual(0, suffixes_diff({}))
 
@@ -54,3 +93,26 @@ class TestSuffixes(unittest.TestCase):
     def test_diff2(self):
         self.assertEqual(2, suffixes_diff({'a': {'diff1': {'diff2': {'': {}}}},
                                            'b': {'': {}}}))
+
+    def test_pooled(self):
+        pool = NodePool()
+        d = {'a': {'diff1': {'diff2': {'': {}}}},
+             'b': {'': {}}}
+        self.assertEqual(2, suffixes_diff(d, pool))
+        self.assertTrue(pool.diffs)
+        self.assertEqual(2, suffixes_diff(d, pool))
+
+    def test_limit(self):
+        d = {'a': {'x': {'': {}}, 'y': {'': {}}, 'z': {'': {}}},
+             'b': {'': {}}}
+        self.assertEqual(3, suffixes_diff(d))
+        self.assertGreater(suffixes_diff(d, limit=1), 1)
+        self.assertLessEqual(suffixes_diff(d, limit=1), 3)
+        self.assertEqual(3, suffixes_diff(d, NodePool(), limit=3))
+
+    def test_diff_symmetric(self):
+        pool = NodePool()
+        a = {'x': {'': {}}, 'y': {'z': {'': {}}}}
+        b = {'x': {'': {}}}
+        self.assertEqual(dict_diff_recursive(a, b), dict_diff_recursive(a, b, pool))
+        self.assertEqual(dict_diff_recursive(b, a), dict_diff_recursive(b, a, pool))
@@ -0,0 +1,45 @@
+import unittest
+
+from regroup import DAWG, DAWGRelaxer, NodePool, Stats, Trie, match
+from regroup.stats import dawg_size
+
+
+class TestStats(unittest.TestCase):
+
+    strings = ['P1Black', 'P1Blue', 'P1Green', 'P1Red', 'P2Black', 'P2Blue', 'P2Green']
+
+    def test_pipeline(self):
+        stats = Stats()
+        dawg = DAWG.from_trie(Trie.from_stream(self.strings, stats=stats), stats=stats)
+        pattern = DAWGRelaxer(dawg).relax(stats=stats).serialize(stats=stats)
+        self.assertEqual(['trie', 'dawg', 'relax', 'serialize'], list(stats.timings))
+        self.assertEqual(7, stats.counts['strings'])
+        self.assertEqual(1, stats.counts['relax iterations'])
+        self.assertEqual(len(pattern), stats.counts['pattern length'])
+        self.assertLess(stats.counts['dawg nodes'], stats.counts['trie nodes'])
+
+    def test_other_paths(self):
+        single = Stats()
+        DAWG.from_trie(Trie.from_stream(self.strings, stats=single), stats=single)
+        for build in (lambda stats: DAWG.from_external(self.strings, stats=stats),
+                      lambda stats: DAWG.from_sharded(self.strings, jobs=2, stats=stats)):
+            stats = Stats()
+            dawg = build(stats)
+            self.assertEqual(7, stats.counts['strings'])
+            self.assertEqual(single.counts['dawg nodes'], stats.counts['dawg nodes'])
+        self.assertEqual(single.counts['trie nodes'], stats.counts['trie nodes'])
+        for serialize in (lambda stats: [dawg.serialize_disjoint(stats=stats)],
+                          lambda stats: dawg.serialize_bounded(max_length=12, stats=stats)):
+            stats = Stats()
+            patterns = serialize(stats)
+            self.assertIn('serialize', stats.timings)
+            self.assertEqual(sum(map(len, patterns)), stats.counts['pattern length'])
+
+    def test_match(self):
+        stats = Stats()
+        self.assertEqual(match(self.strings), match(self.strings, stats=stats))
+        self.assertEqual({'timings', 'counts'}, set(stats.as_dict()))
+
+    def test_dawg_size(self):
+        # the end-of-string leaf is shared, so it is counted once
+        self.assertEqual((3, 3), dawg_size(NodePool().intern({'a': {'': {}}, 'b': {'': {}}})))
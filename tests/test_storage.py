@@ -0,0 +1,74 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+from regroup import DAWG, DAWGRelaxer, TagClass, serialize_clusters
+from regroup.stats import dawg_size
+from regroup.storage import MappedNode, Store
+
+
+class TestStorage(unittest.TestCase):
+
+    strings = ['EFgreen', 'EFgrey', 'EntireS1', 'EntireS2', 'J27GreenP1', 'J27GreenP2',
+               'J27RedP1', 'J27RedP2', 'JournalP1Black', 'JournalP1Blue',
+               'JournalP1Green', 'JournalP1Red', 'JournalP2Black', 'JournalP2Blue',
+               'JournalP2Green', 'naïve']
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.dawg = DAWG.from_list(self.strings)
+        self.dawg.save(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_roundtrip(self):
+        loaded = DAWG.load(self.path)
+        self.assertEqual(self.dawg.dawg, loaded.dawg.as_dict())
+        self.assertEqual(self.dawg.serialize(), loaded.serialize())
+
+    def test_shared(self):
+        # each interned node is stored once and maps back to one view
+        store = Store(self.path)
+        self.assertEqual(dawg_size(self.dawg.dawg)[0], len(store))
+        self.assertIs(store.root()['J'], store.root()['J'])
+
+    def test_operations(self):
+        self.assertEqual(self.dawg.cluster_by_prefixlen(2),
+                         [(p, v.as_dict()) for p, v in DAWG.load(self.path).cluster_by_prefixlen(2)])
+        self.assertEqual(DAWGRelaxer(self.dawg).relax().serialize(),
+                         DAWGRelaxer(DAWG.load(self.path)).relax().serialize())
+
+    def test_in_place(self):
+        # reading a loaded DAWG leaves its nodes in the file rather than copying them
+        loaded = DAWG.load(self.path)
+        fp = io.StringIO()
+        loaded.dump(fp)
+        self.assertEqual(self.dawg.serialize(), fp.getvalue())
+        self.assertEqual(self.dawg.serialize(), loaded.serialize())
+        self.assertEqual(self.dawg.serialize_disjoint(), loaded.serialize_disjoint())
+        self.assertIsInstance(loaded.dawg, MappedNode)
+        self.assertLess(len(loaded.pool), len(loaded.storage) // 2)
+
+    def test_pickle(self):
+        # a node crosses processes as where it is in the file, not as its subgraph
+        node = Store(self.path).root()['J']
+        sent = pickle.dumps(node)
+        self.assertLess(len(sent), len(pickle.dumps(node.as_dict())))
+        self.assertEqual(node.as_dict(), pickle.loads(sent).as_dict())
+        clusters = DAWG.load(self.path).cluster_by_prefixlen(2)
+        self.assertEqual(list(serialize_clusters(self.dawg.cluster_by_prefixlen(2))),
+                         list(serialize_clusters(clusters, jobs=2)))
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            DAWG.load(self.path)
+
+    def test_string_labels(self):
+        with self.assertRaises(TypeError):
+            DAWG.from_dawg({TagClass('$n', ['1']): {'': {}}}).save(self.path)
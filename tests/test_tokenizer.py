@@ -0,0 +1,70 @@
+
+import re
+import unittest
+
+from regroup import DictionaryTokenizer, TaggingTokenizer
+
+
+class TestDictionaryTokenizer(unittest.TestCase):
+
+    words = ['green', 'grey', 'journal', 'red', 'j', 'jo', 'jour']
+
+    def test_longest(self):
+        tok = DictionaryTokenizer(self.words)
+        self.assertEqual(['journal', 'p', '1', 'green'],
+                         list(tok.tokenize('journalp1green')))
+
+    def test_shortest(self):
+        tok = DictionaryTokenizer(self.words, longest=False)
+        self.assertEqual(['j', 'ournalp', '1', 'green'],
+                         list(tok.tokenize('journalp1green')))
+
+    def test_fallback(self):
+        tok = DictionaryTokenizer()
+        self.assertEqual(['EF', 'green', '27', '  ', '-', '\n'],
+                         list(tok.tokenize('EFgreen27  -\n')))
+
+    def test_nexttoken(self):
+        tok = DictionaryTokenizer(self.words)
+        self.assertEqual('jour', tok.nexttoken('jourx'))
+        self.assertEqual('x', tok.nexttoken('x'))
+
+
+class TestTaggingTokenizer(unittest.TestCase):
+
+    tags = {
+        '$color': set('Black Blue Green Red'.split()),
+        '$number': re.compile(r'\d+'),
+    }
+
+    def test_tokenize(self):
+        tok = TaggingTokenizer(self.tags)
+        self.assertEqual([('J', None), ('27', '$number'), ('Green', '$color'),
+                          ('P', None), ('1', '$number')],
+                         list(tok.tokenize('J27GreenP1')))
+        self.assertEqual([('EF', None), ('green', None)],
+                         list(tok.tokenize('EFgreen')))
+
+    def test_longest(self):
+        tok = TaggingTokenizer({'$short': ['ab'], '$long': re.compile('abc'),
+                                '$tie': re.compile('ab')})
+        self.assertEqual([('abc', '$long'), ('ab', '$short')],
+                         list(tok.tokenize('abcab')))
+
+    def test_anchored(self):
+        # a regex match further along the string does not tag the current position
+        tok = TaggingTokenizer({'$number': re.compile(r'\d+')})
+        self.assertEqual(('x', None), tok.nexttoken('x12'))
+        self.assertEqual([('x', None), ('12', '$number')], list(tok.tokenize('x12')))
+
+    def test_context(self):
+        # anchors and word boundaries see each token's start as the start of the text
+        for pattern in (r'^\d+', r'\b\d+', r'(?<!x)\d+'):
+            tok = TaggingTokenizer({'$number': re.compile(pattern)})
+            self.assertEqual([('x', None), ('12', '$number')], list(tok.tokenize('x12')), pattern)
+
+    def test_interned(self):
+        tok = TaggingTokenizer(self.tags)
+        a, b = list(tok.tokenize('1a1'))[::2]
+        self.assertIs(a, b)
+        self.assertEqual(('1', '$number'), (a.string, a.tag))